@@ -0,0 +1,249 @@
+"""
+Extraction stack benchmark on the fixed sample in `corpus.json` (datasheet paths below the datasheets dir and table
+rows from `parse_line_tests`).
+
+Times `extract_text`, `tabula_pdf_dataframes`, `tabula_read` and `parse_datasheet` cold (empty cache dir, including
+the stages each depends on) and warm (disk cache hit, memory tiers cleared), and `parse_row_value` on the rows.
+Reports throughput and the tracemalloc peak (Python allocations only, not MuPDF's or tabula's JVM) and compares
+against the baselines file:
+
+    python benchmarks/corpus.py
+    python benchmarks/corpus.py --save          # store the results as new baselines
+    python benchmarks/corpus.py --stage parse_row_value --tolerance .1
+
+Rates are compared relative to a fixed pure-Python `reference` workload timed in the same run, so the committed
+baselines (`baselines.json`, with the machine they were recorded on) hold on other machines too. Absolute rates are
+only compared on the same machine and Python. Exits with 1 on a regression.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+root = os.path.realpath(os.path.dirname(__file__) + '/..')
+sys.path.insert(0, root)
+
+from dslib import cache
+
+
+def pdf_stages():
+    from dslib.pdf2txt import parse
+    return dict(
+        extract_text=lambda p, mfr, mpn: parse.extract_text(p),
+        tabula_pdf_dataframes=lambda p, mfr, mpn: parse.tabula_pdf_dataframes(p),
+        tabula_read=lambda p, mfr, mpn: parse.tabula_read(p),
+        parse_datasheet=lambda p, mfr, mpn: parse.parse_datasheet(p, mfr=mfr, mpn=mpn),
+    )
+
+
+def clear_mem_tiers():
+    from dslib.pdf2txt import parse
+    for fn in (parse.extract_pages, parse.tabula_pdf_dataframes, parse.pymupdf_tables, parse.parse_datasheet):
+        fn.mem_tier.clear()
+
+
+def fresh_cache_dir(base):
+    """
+    Point the disk caches (and the failure registry) to a new empty dir.
+    """
+    from dslib.pdf2txt import failures
+    cache.cache_dir = tempfile.mkdtemp(dir=base)
+    failures._registry = None
+    clear_mem_tiers()
+
+
+def run_items(fn, items, trace=False):
+    """
+    :return: (seconds, errors, tracemalloc peak bytes or None)
+    """
+    errors = 0
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    # like main.py, each datasheet is stat'ed once per pass
+    with cache.dependency_stat_cache():
+        for it in items:
+            try:
+                fn(*it)
+            except Exception as e:
+                errors += 1
+                if errors == 1:
+                    print('  %s: %s' % (type(e).__name__, str(e)[:120]), file=sys.stderr)
+    dt = time.perf_counter() - t0
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return dt, errors, peak
+
+
+def bench_pdf_stage(name, fn, items, tmp, memory):
+    res = {}
+    for mode in ('cold', 'warm'):
+        if mode == 'cold':
+            fresh_cache_dir(tmp)
+        else:
+            clear_mem_tiers()
+        dt, errors, _ = run_items(fn, items)
+        peak = None
+        if memory:
+            # separate pass, tracemalloc slows down the timing
+            if mode == 'cold':
+                fresh_cache_dir(tmp)
+            else:
+                clear_mem_tiers()
+            peak = run_items(fn, items, trace=True)[2]
+        res['%s/%s' % (name, mode)] = dict(rate=len(items) / dt, unit='pdf/s', errors=errors,
+                                          peak_mb=peak and round(peak / 1e6, 2))
+    return res
+
+
+def machine_info() -> dict:
+    return dict(machine=platform.machine(), processor=platform.processor() or None, cpus=os.cpu_count(),
+                system=platform.system(), python='%s %s' % (platform.python_implementation(), platform.python_version()))
+
+
+def reference_workload(n=2000):
+    """
+    Fixed string/regex/dict work, independent of dslib, to scale rates between machines.
+    """
+    r = re.compile(r'(\d+(?:\.\d+)?)\s*(nC|pF|ns)')
+    d = {}
+    for i in range(n):
+        s = 'Qrr,IF=%dA,di/dt=100A/us,-,%d.%d nC,-' % (i, i % 97, i % 7)
+        for m in r.finditer(s.replace('-', ' ')):
+            d[m.group(2)] = d.get(m.group(2), 0.) + float(m.group(1))
+        d[s[:8]] = json.loads(json.dumps(s.split(',')))
+    return len(d)
+
+
+def bench_reference(repeat):
+    dt = min(run_items(reference_workload, [()])[0] for _ in range(repeat))
+    return {'reference': dict(rate=1 / dt, unit='runs/s', errors=0, peak_mb=None)}
+
+
+def bench_rows(rows, repeat, memory):
+    from dslib.pdf2txt.parse import parse_row_value
+    # repeated to about 50ms per pass, a single pass over the rows is too short to time reliably
+    items = [(r['row'], r['dim'], r['sym']) for r in rows] * 20
+    fn = lambda row, dim, sym: parse_row_value(row, dim, field_sym=sym)
+    run_items(fn, items)  # compile the regexes
+    dt = min(run_items(fn, items)[0] for _ in range(repeat))
+    peak = run_items(fn, items, trace=True)[2] if memory else None
+    return {'parse_row_value/warm': dict(rate=len(items) / dt, unit='rows/s', errors=0,
+                                         peak_mb=peak and round(peak / 1e6, 2))}
+
+
+def add_relative(results):
+    """
+    Set `rel`, the rate in units per reference run, on all results.
+    """
+    ref = results['reference']['rate']
+    for r in results.values():
+        r['rel'] = r['rate'] / ref
+
+
+def compare(results, baselines, tolerance, same_machine=False):
+    """
+    :param baselines: {key: result}, with `rel` rates (see `add_relative`)
+    :param same_machine: also compare absolute rates
+    :return: list of regression messages
+    """
+    regressions = []
+    for key, r in results.items():
+        b = baselines.get(key)
+        if not b or r['errors'] or key == 'reference':
+            continue
+        if b.get('rel') and r['rel'] < b['rel'] * (1 - tolerance):
+            regressions.append('%s: %.3g %s per reference run, baseline %.3g' % (key, r['rel'], r['unit'].split('/')[0],
+                                                                               b['rel']))
+        elif same_machine and r['rate'] < b['rate'] * (1 - tolerance):
+            regressions.append('%s: %.1f %s, baseline %.1f' % (key, r['rate'], r['unit'], b['rate']))
+        if r['peak_mb'] and b.get('peak_mb') and r['peak_mb'] > b['peak_mb'] * (1 + tolerance) + 1:
+            regressions.append('%s: peak %.1f MB, baseline %.1f MB' % (key, r['peak_mb'], b['peak_mb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasheets', default=os.path.join(root, 'datasheets'))
+    parser.add_argument('--manifest', default=os.path.join(root, 'benchmarks', 'corpus.json'))
+    parser.add_argument('--baselines', default=os.path.join(root, 'benchmarks', 'baselines.json'))
+    parser.add_argument('--stage', action='append', help='only these stages (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5, help='repeats of the row benchmark')
+    parser.add_argument('--tolerance', type=float, default=.25, help='allowed relative slowdown')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc passes')
+    parser.add_argument('--save', action='store_true', help='write results as baselines')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    items = []
+    for rel in manifest['datasheets']:
+        path = os.path.join(args.datasheets, rel)
+        if os.path.isfile(path):
+            mfr, fn = rel.split('/')
+            items.append((path, mfr, fn[:-4]))
+    print('corpus: %d of %d datasheets found in %s, %d table rows' % (
+        len(items), len(manifest['datasheets']), args.datasheets, len(manifest['rows'])))
+
+    results = bench_reference(args.repeat)
+    want = lambda name: not args.stage or name in args.stage
+    if want('parse_row_value'):
+        results.update(bench_rows(manifest['rows'], args.repeat, not args.no_memory))
+
+    if items:
+        tmp = tempfile.mkdtemp(prefix='dslib-bench-')
+        cache_dir = cache.cache_dir
+        try:
+            for name, fn in pdf_stages().items():
+                if want(name):
+                    print('%s ...' % name, file=sys.stderr)
+                    results.update(bench_pdf_stage(name, fn, items, tmp, not args.no_memory))
+        finally:
+            cache.cache_dir = cache_dir
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    add_relative(results)
+
+    saved = dict(machine=None, results={})
+    if os.path.isfile(args.baselines):
+        with open(args.baselines) as f:
+            saved = json.load(f)
+    baselines = saved['results']
+    same_machine = saved['machine'] == machine_info()
+    if saved['machine'] and not same_machine:
+        print('baselines recorded on %s, comparing rates relative to the reference' % saved['machine'])
+
+    print('%-28s %16s %10s %6s %10s %10s' % ('stage', 'rate', 'rel', 'errors', 'peak [MB]', 'baseline rel'))
+    for key, r in results.items():
+        b = baselines.get(key)
+        print('%-28s %9.1f %-6s %10.4g %6d %10s %10s' % (key, r['rate'], r['unit'], r['rel'], r['errors'],
+                                                         '-' if r['peak_mb'] is None else '%.1f' % r['peak_mb'],
+                                                         '%.4g' % b['rel'] if b else '-'))
+
+    if args.save:
+        if not same_machine:
+            # absolute rates of another machine don't mix
+            baselines = {}
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(dict(machine=machine_info(), results=baselines), f, indent=1, sort_keys=True)
+        print('saved baselines to', args.baselines)
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance, same_machine)
+    for msg in regressions:
+        print('REGRESSION', msg)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
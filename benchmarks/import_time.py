@@ -0,0 +1,77 @@
+"""
+Import-time benchmark for dslib modules and CLI scripts.
+
+Each module is imported in a fresh interpreter (`python -X importtime`), best of `--repeat` runs is reported.
+Also checks that no heavy dependency is imported and no thread is started as a side effect of the import.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --max-ms 150 dslib.pdf2txt.parse
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+root = os.path.realpath(os.path.dirname(__file__) + '/..')
+
+modules = [
+    'dslib',
+    'dslib.cache',
+    'dslib.field',
+    'dslib.spec_models',
+    'dslib.store',
+    'dslib.powerloss',
+    'dslib.pdf2txt.parse',
+    'power_loss_calc',
+]
+
+heavy = ['pandas', 'numpy', 'psutil', 'pytz', 'pyarrow', 'streamz', 'pympler', 'fitz', 'tabula']
+
+_probe = '''
+import sys, threading
+import {module}
+print('HEAVY=' + ','.join(m for m in {heavy!r} if m in sys.modules))
+print('THREADS=%d' % threading.active_count())
+'''
+
+
+def measure(module):
+    """
+    :return: (cumulative import time [ms], imported heavy modules, number of threads)
+    """
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', _probe.format(module=module, heavy=heavy)],
+                       cwd=root, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=root))
+    if p.returncode:
+        raise RuntimeError(f'importing {module} failed: {p.stderr[-2000:]}')
+    us = None
+    for line in p.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            us = int(parts[1])
+    out = dict(line.split('=', 1) for line in p.stdout.splitlines() if '=' in line)
+    return us / 1e3, [m for m in out['HEAVY'].split(',') if m], int(out['THREADS'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=modules)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if any import takes longer')
+    args = parser.parse_args()
+
+    failed = False
+    print('%-24s %10s  %-8s %s' % ('module', 'ms', 'threads', 'heavy imports'))
+    for m in args.modules:
+        runs = [measure(m) for _ in range(args.repeat)]
+        ms = min(r[0] for r in runs)
+        _, hv, threads = runs[0]
+        print('%-24s %10.1f  %-8d %s' % (m, ms, threads, ', '.join(hv) or '-'))
+        if hv or threads > 1 or (args.max_ms and ms > args.max_ms):
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
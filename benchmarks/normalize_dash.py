@@ -0,0 +1,118 @@
+"""
+normalize_dash micro-benchmark: the character table (`replace_chars`) vs the former chain of str.replace calls and
+vs str.translate.
+
+Runs on the datasheet corpus (page texts via the `extract_pages` cache, lines and words standing in for table rows
+and cells), or on a synthetic corpus if no datasheets are found.
+
+    python benchmarks/normalize_dash.py
+    python benchmarks/normalize_dash.py --datasheets datasheets --limit 200
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+root = os.path.realpath(os.path.dirname(__file__) + '/..')
+sys.path.insert(0, root)
+
+from dslib.pdf2txt import dash_map, normalize_dash
+
+
+def normalize_dash_replace(s):
+    # the implementation before the character table
+    s = s.replace('\u2010', '-')
+    s = s.replace('\u2011', '-')
+    s = s.replace('\u2212', '-')
+    s = s.replace('\u2013', '-')
+    s = s.replace('\u2014', '-')
+    s = s.replace('\ue025', '-')
+    s = s.replace('\u0192', 'f')
+    s = s.replace('\u201c', '"')
+    s = s.replace('\u201d', '"')
+    return s
+
+
+_translate_table = str.maketrans(dash_map)
+
+
+def normalize_dash_translate(s):
+    return s.translate(_translate_table)
+
+
+def corpus_from_datasheets(datasheet_dir, limit):
+    from dslib.pdf2txt.parse import extract_pages
+    texts, rows = [], []
+    for fn in sorted(glob.glob(os.path.join(datasheet_dir, '*', '*.pdf')))[:limit]:
+        try:
+            pages = extract_pages(fn)
+        except Exception as e:
+            print(fn, e, file=sys.stderr)
+            continue
+        texts.append(''.join(pages))
+        # table rows and cells as tabula_read sees them, approximated by lines and words
+        for page in pages:
+            for line in page.splitlines():
+                rows.append(line)
+                rows.extend(line.split(' '))
+    return texts, rows
+
+
+def synthetic_corpus(n_docs=50, seed=1):
+    rnd = random.Random(seed)
+    words = ['Reverse', 'recovery', 'charge', 'Qrr', 'VDS', '=', '50V', 'ID', '100A', 'nC', '25', 'Min', 'Typ.',
+             'Max', 'Unit', '\u2013', '\u2212', '\u201cNote\u201d', '\ue025', '-55', '175', '\u0192']
+    texts, rows = [], []
+    for _ in range(n_docs):
+        lines = [' '.join(rnd.choice(words) if rnd.random() < .2 else rnd.choice(words[:15])
+                          for _ in range(rnd.randint(1, 12))) for _ in range(2000)]
+        texts.append('\n'.join(lines))
+        for line in lines:
+            rows.append(line)
+            rows.extend(line.split(' '))
+    return texts, rows
+
+
+def bench(fn, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in items:
+            fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasheets', default=os.path.join(root, 'datasheets'))
+    parser.add_argument('--limit', type=int, default=500, help='max number of datasheets')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts, rows = corpus_from_datasheets(args.datasheets, args.limit) if os.path.isdir(args.datasheets) else ([], [])
+    source = 'datasheets'
+    if not texts:
+        texts, rows = synthetic_corpus()
+        source = 'synthetic'
+
+    non_ascii = sum(not r.isascii() for r in rows)
+    print('corpus: %s, %d texts (%.1f MB), %d rows/cells (%.1f%% non-ascii), %d mapped chars' % (
+        source, len(texts), sum(map(len, texts)) / 1e6, len(rows), non_ascii / max(len(rows), 1) * 100,
+        len(dash_map)))
+
+    for s in texts + rows[:10000]:
+        assert normalize_dash(s) == normalize_dash_replace(s), repr(s[:80])
+
+    print('%-12s %12s %14s %12s %8s' % ('', 'replace [ms]', 'translate [ms]', 'table [ms]', 'speedup'))
+    for name, items in [('texts', texts), ('rows/cells', rows)]:
+        t_old = bench(normalize_dash_replace, items, args.repeat)
+        t_tr = bench(normalize_dash_translate, items, args.repeat)
+        t_new = bench(normalize_dash, items, args.repeat)
+        print('%-12s %12.1f %14.1f %12.1f %7.1fx' % (name, t_old * 1e3, t_tr * 1e3, t_new * 1e3, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark and fuzz harness for the table row regexes (`get_dim_regs`, used by `parse_row_value`).
+
+Seeds are the table rows of `corpus.json` (from `parse_line_tests`) and the example rows in the docstring of
+`field_value_regex_variations`. Reports the time per row of each pattern, then fuzzes every pattern with
+mutated seeds and pumped inputs (a row head followed by a growing run of condition-like text without a valid
+unit, the worst case for the nested optional groups). A pattern is flagged as backtracking if its time grows
+faster than `--max-exponent` with the input length or exceeds `--max-ms` on a single input. Each pattern is fuzzed
+in a supervised worker process, a catastrophic one is killed after `--timeout` seconds.
+
+Pattern times are compared relative to the `reference` workload of `corpus.py`, timed in the same run, against the
+committed `regex_baselines.json`. Exits with 1 on any finding (backtracking, slowdown or changed parse results):
+
+    python benchmarks/parse_regex.py
+    python benchmarks/parse_regex.py --save      # store pattern times and parse results of the seeds
+
+Runs as a pre-commit hook on changes of the parser (`.pre-commit-config.yaml`, `pre-commit install`) and from
+tests.py.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+root = os.path.realpath(os.path.dirname(__file__) + '/..')
+sys.path.insert(0, root)
+
+# a typical head of each dimension, the pumped inputs start with it
+dim_heads = dict(t='Rise time tr', Q='Reverse recovery charge Qrr', C='Output capacitance Coss',
+                 V='Gate plateau voltage Vplateau')
+
+# condition-like fragments (characters of `test_cond_broad`, fields and separators)
+pumps = [' ', ',', '-', '-,', 'nan,', ',-', ' 1,', '1.', 'a ', 'V = 0 ', '= 50 V, ', ', ,', ' - ']
+
+# pumped input lengths, in pump repetitions
+pump_steps = [8, 16, 32, 64]
+
+
+def seed_rows():
+    """
+    :return: [(row, dim, field symbol)]
+    """
+    from dslib.pdf2txt.parse import field_value_regex_variations
+    with open(os.path.join(root, 'benchmarks', 'corpus.json')) as f:
+        rows = [(r['row'], r['dim'], r['sym']) for r in json.load(f)['rows']]
+
+    # docstring examples, e.g. 'Qrr no value match Reverse Recovery Charge Qrr nCIF = 80A, VGS = 0V--,297,--,nan'
+    for line in field_value_regex_variations.__doc__.splitlines():
+        line = line.strip().strip('"')
+        if ',' not in line or line.startswith(':'):
+            continue
+        line = re.sub(r'^\w+ no value match( in)?\s*', '', line).strip().strip('"')
+        dim = next((d for d, h in [('C', 'capacitance'), ('Q', 'charge'), ('t', 'time'), ('V', 'voltage')]
+                    if h in line.lower()), 'Q')
+        rows.append((line, dim, dim))
+    return rows
+
+
+def parse_results(rows) -> dict:
+    """
+    :return: {row: 'min typ max unit' of `parse_row_value`, or None}
+    """
+    from dslib.pdf2txt.parse import parse_row_value
+    res = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for row, dim, sym in rows:
+            f = parse_row_value(row, dim, field_sym=sym)
+            res[row] = f and '%s %s %s %s' % (f.min, f.typ, f.max, f.unit)
+    return res
+
+
+def mutate(row, rnd):
+    """
+    Random edit of a row: drop or duplicate a cell, insert condition text, break the unit, swap a field for nan/-.
+    """
+    cells = row.split(',')
+    op = rnd.randrange(5)
+    i = rnd.randrange(len(cells))
+    if op == 0 and len(cells) > 1:
+        del cells[i]
+    elif op == 1:
+        cells.insert(i, cells[i])
+    elif op == 2:
+        cells[i] += rnd.choice(pumps) * rnd.randint(1, 20)
+    elif op == 3:
+        cells[-1] = cells[-1] + 'x'
+    else:
+        cells[i] = rnd.choice(['nan', '-', '--', '', '1.5'])
+    return ','.join(cells)
+
+
+def time_match(r, s, repeat=3):
+    """
+    Best time of the search `parse_row_value` does, seconds.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        next(r.finditer(s), None)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def time_rows(r, rows, repeat):
+    """
+    Best time of a pass of the `parse_row_value` search over the rows, seconds. A pass per timer call, single
+    searches of a few µs are too short to time.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in rows:
+            next(r.finditer(s), None)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def pattern_rows(rows, dim):
+    return [row for row, d, _ in rows if d == dim] or [row for row, _, _ in rows]
+
+
+def bench_patterns(rows, repeat, keys=None):
+    """
+    :param keys: only these patterns
+    :return: {'<dim>/<index>': µs per row} over the seed rows of the pattern's dimension
+    """
+    from dslib.pdf2txt.parse import get_dim_regs
+    res = {}
+    for dim, regs in get_dim_regs().items():
+        dim_rows = pattern_rows(rows, dim)
+        for i, r in enumerate(regs):
+            key = '%s/%d' % (dim, i)
+            if keys is None or key in keys:
+                res[key] = time_rows(r, dim_rows, repeat) / len(dim_rows) * 1e6
+    return res
+
+
+def fuzz_pattern(dim, index, n_mutations=300, seed=1, stop_ms=1000.):
+    """
+    Runs in a worker process.
+    :param stop_ms: don't pump further once an input takes this long
+    :return: dict(worst_ms, worst_input, exponent, pump) of the pattern
+    """
+    from dslib.pdf2txt.parse import get_dim_regs
+    r = get_dim_regs()[dim][index]
+    rnd = random.Random(seed)
+    rows = [row for row, _, _ in seed_rows()]
+
+    worst_ms, worst_input = 0., ''
+    for _ in range(n_mutations):
+        s = mutate(rnd.choice(rows), rnd)
+        t = time_match(r, s, repeat=1) * 1e3
+        if t > worst_ms:
+            worst_ms, worst_input = t, s
+
+    # growth of the match time with the length of a pumped condition string
+    exponent, worst_pump = 0., None
+    for pump in pumps:
+        times = []
+        for k in pump_steps:
+            s = dim_heads[dim] + ',' + pump * k + ',12,xx'
+            t = time_match(r, s) * 1e3
+            times.append(t)
+            if t > worst_ms:
+                worst_ms, worst_input = t, s
+            if t > stop_ms:
+                break
+        # exponent of the last doubling, noise floor 20µs
+        if len(times) > 1 and times[-2] > .02:
+            e = math.log(times[-1] / times[-2], 2)
+            if e > exponent:
+                exponent, worst_pump = e, pump
+    return dict(worst_ms=worst_ms, worst_input=worst_input[:200], exponent=exponent, pump=worst_pump)
+
+
+def fuzz_all(timeout):
+    from dslib.pdf2txt.parse import get_dim_regs
+    from dslib.pdf2txt.supervisor import SupervisedExecutor
+    tasks = [(dim, i) for dim, regs in get_dim_regs().items() for i in range(len(regs))]
+    res = {}
+    with SupervisedExecutor(timeout=timeout, shm_results=False) as ex:
+        for (dim, i), r, err in ex.map(fuzz_pattern, tasks):
+            res['%s/%d' % (dim, i)] = r or dict(worst_ms=math.inf, worst_input='', exponent=math.inf, pump=None,
+                                                error=str(err))
+    return res
+
+
+def reference_ms(repeat):
+    from corpus import reference_workload
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        reference_workload()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baselines', default=os.path.join(root, 'benchmarks', 'regex_baselines.json'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=100., help='max time of one pattern on one fuzz input')
+    parser.add_argument('--max-exponent', type=float, default=3.5,
+                        help='max growth exponent of the time with the pumped input length (2 = quadratic)')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to fuzz one pattern')
+    parser.add_argument('--tolerance', type=float, default=.5, help='allowed relative slowdown per pattern')
+    parser.add_argument('--save', action='store_true', help='write pattern times and parse results as baselines')
+    args = parser.parse_args(argv)
+
+    from dslib.pdf2txt.parse import get_dim_regs
+    regs = {'%s/%d' % (dim, i): r for dim, rr in get_dim_regs().items() for i, r in enumerate(rr)}
+
+    findings, slow = [], []
+    rows = seed_rows()
+    print('%d patterns, %d seed rows' % (len(regs), len(rows)))
+    results = parse_results(rows)
+    ref_ms = reference_ms(args.repeat)
+    times = bench_patterns(rows, args.repeat)
+    # µs per row per ms of the reference run, comparable across machines
+    rel = {k: t / ref_ms for k, t in times.items()}
+    fuzz = fuzz_all(args.timeout)
+
+    baselines = dict(machine=None, times={}, results={})
+    if os.path.isfile(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    for row, r in results.items():
+        if row in baselines['results'] and baselines['results'][row] != r:
+            findings.append('parse result changed: %r: %s, baseline %s' % (row, r, baselines['results'][row]))
+
+    print('reference %.1f ms' % ref_ms)
+    print('%-6s %10s %10s %10s %12s %9s  %s' % ('regex', 'µs/row', 'rel', 'baseline', 'fuzz max ms', 'exponent',
+                                                'pattern'))
+    for key in sorted(times, key=times.get, reverse=True):
+        fz, b = fuzz[key], baselines['times'].get(key)
+        print('%-6s %10.1f %10.3f %10s %12.2f %9.2f  %s' % (key, times[key], rel[key], '%.3f' % b if b else '-',
+                                                             fz['worst_ms'], fz['exponent'], regs[key].pattern[:70]))
+        if fz.get('error'):
+            findings.append('%s: fuzzing killed (%s), catastrophic backtracking' % (key, fz['error']))
+        elif fz['worst_ms'] > args.max_ms:
+            findings.append('%s: %.1f ms on %r' % (key, fz['worst_ms'], fz['worst_input']))
+        elif fz['exponent'] > args.max_exponent:
+            findings.append('%s: time grows with length^%.1f, pump %r' % (key, fz['exponent'], fz['pump']))
+        # plus a noise floor of 1µs
+        if b and rel[key] > b * (1 + args.tolerance) + 1e-3 / ref_ms:
+            slow.append(key)
+
+    # re-time the slow ones, a finding only if they are slow again
+    for key, t in bench_patterns(rows, args.repeat * 4, set(slow)).items():
+        b = baselines['times'][key]
+        if t / ref_ms > b * (1 + args.tolerance) + 1e-3 / ref_ms:
+            findings.append('%s: %.3f µs/row per reference ms, baseline %.3f' % (key, t / ref_ms, b))
+
+    if args.save:
+        machine = dict(machine=platform.machine(), cpus=os.cpu_count(), python=platform.python_version())
+        with open(args.baselines, 'w') as f:
+            json.dump(dict(machine=machine, times={k: round(v, 4) for k, v in rel.items()}, results=results), f,
+                      indent=1, sort_keys=True, ensure_ascii=False)
+        print('saved baselines to', args.baselines)
+        return 0
+
+    for msg in findings:
+        print('FINDING', msg)
+    return 1 if findings else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,25 +3,23 @@ import hashlib
 import os
 import pickle
 import random
+import re
 import string
+import sys
 import threading
 import time
 import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 from os.path import expanduser
 from threading import Thread, Lock, RLock
 from typing import Callable, Optional, Tuple, Union
 
-import pandas as pd
-import psutil
-from pandas.core.generic import NDFrame
-
 from dslib import get_logger
 
-try:
-    from streamz.collection import Streaming
-except ImportError:
-    print('failed to import streamz module')
+# heavy dependencies (pandas, psutil, pyarrow, pympler) are imported on first use, importing this module
+# must stay cheap as every cached function depends on it
 
 # from lib.data.util import concat, random_str
 # from lib.util import to_closed_time_range, setup_custom_logger, to_iso, timedelta_to_str
@@ -33,22 +31,42 @@ ran_housekeeping = False
 logger = get_logger()
 
 
+_parquet_engine = None
+
+
 def get_parquet_engine():
-    try:
-        import pyarrow
-        return 'pyarrow'
-    except ImportError:
-        logger.warning("pyarrow not installed, using engine `fastparquet`")
-        return 'fastparquet'
+    global _parquet_engine
+    if _parquet_engine is None:
+        try:
+            import pyarrow
+            _parquet_engine = 'pyarrow'
+        except ImportError:
+            logger.warning("pyarrow not installed, using engine `fastparquet`")
+            _parquet_engine = 'fastparquet'
+    return _parquet_engine
 
 
-parquet_engine = get_parquet_engine()
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
 
-import pytz
 
+_ttl_units = dict(d='days', day='days', days='days', h='hours', hour='hours', hours='hours',
+                  min='minutes', m='minutes', s='seconds', sec='seconds')
 
-def now():
-    return datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+
+def to_timedelta(ttl) -> datetime.timedelta:
+    """
+    Convert a ttl like '30d', '12h' or '15min' to a timedelta without importing pandas.
+    Anything else is handed to `pd.to_timedelta`.
+    """
+    if isinstance(ttl, datetime.timedelta):
+        return ttl
+    if isinstance(ttl, str):
+        m = re.fullmatch(r'\s*([0-9]+(?:\.[0-9]+)?)\s*([a-z]+)\s*', ttl)
+        if m and m[2] in _ttl_units:
+            return datetime.timedelta(**{_ttl_units[m[2]]: float(m[1])})
+    import pandas as pd
+    return pd.to_timedelta(ttl).to_pytimedelta()
 
 
 def random_str(n=12):
@@ -80,24 +98,16 @@ def touch(fname, times=None):
         os.utime(fname, times)
 
 
-def _disk_cache_housekeeping(days_max=7):
+def _disk_cache_housekeeping():
+    """
+    Start the background cache maintenance (see `dslib.cache_maint`), once.
+    """
     global ran_housekeeping
     if ran_housekeeping:
         return
-
-    _now = time.time()
-
-    if os.path.exists(cache_dir):
-        for f in os.listdir(cache_dir):
-            # noinspection PyBroadException
-            try:
-                fp = cache_dir + '/' + f
-                ft = max(os.path.getmtime(fp), os.path.getatime(fp))
-                if (_now - ft) // (24 * 3600) >= days_max:
-                    os.unlink(fp)
-            except:
-                pass
     ran_housekeeping = True
+    from dslib.cache_maint import start_background_maintenance
+    start_background_maintenance()
 
 
 def _get_cache_file(host, db, q, index_format: Union[Tuple[str], str]):
@@ -110,6 +120,7 @@ def read_influx_cache(**kwargs):
     try:
         cache_file = _get_cache_file(**kwargs)
         if os.path.exists(cache_file):
+            import pandas as pd
             touch(cache_file)
             df = pd.read_pickle(cache_file)
             return df
@@ -120,6 +131,7 @@ def read_influx_cache(**kwargs):
 
 
 def write_influx_cache(df, **kwargs):
+    init_cache()
     df.to_pickle(_get_cache_file(**kwargs))
 
 
@@ -164,6 +176,7 @@ class ParquetFileStore:
 
     # noinspection PyMethodMayBeStatic
     def read(self, key):
+        import pandas as pd
         # noinspection PyBroadException
         try:
             fn = _get_fn(key, ext='parquet')
@@ -180,6 +193,7 @@ class ParquetFileStore:
 
     # noinspection PyMethodMayBeStatic
     def write(self, key, df):
+        import pandas as pd
         fn = _get_fn(key, ext='parquet')
         if isinstance(df, pd.Series):
             df = pd.DataFrame({'__series': df})
@@ -190,7 +204,7 @@ class ParquetFileStore:
             df = pd.DataFrame({'__empty': []})
 
         try:
-            df.to_parquet(fn + '.tmp', engine=parquet_engine, compression='snappy')
+            df.to_parquet(fn + '.tmp', engine=get_parquet_engine(), compression='snappy')
         except ValueError as e:
             # columns as MultiIndex fails !
             raise ValueError('failed to parquet dataframe: %s %s %s' % (e, df.columns, df.head()))
@@ -210,6 +224,7 @@ class PandasPickleFileStore:
         pass
 
     def read(self, key):
+        import pandas as pd
         # noinspection PyBroadException
         try:
             fn = _get_fn(key, ext='pkl.gz')
@@ -227,35 +242,211 @@ class PandasPickleFileStore:
         _set_df_file_store_mtime(fn, df)
 
 
+def _lz4_codec():
+    import lz4.frame
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zstd_codec():
+    try:
+        from compression import zstd  # python >= 3.14
+        return zstd.compress, zstd.decompress
+    except ImportError:
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+
+
+# serializer name -> (file extension, codec factory)
+pickle_codecs = {
+    'pickle': ('pickle', None),
+    'lz4': ('pickle.lz4', _lz4_codec),
+    'zstd': ('pickle.zst', _zstd_codec),
+}
+_ext_serializer = {ext: name for name, (ext, _) in pickle_codecs.items()}
+_codecs = {}
+
+
+def _get_codec(serializer):
+    """
+    :return: (ext, compress, decompress) of an available pickle codec, plain pickle if the compression module
+        is missing
+    """
+    codec = _codecs.get(serializer)
+    if codec is None:
+        ext, factory = pickle_codecs[serializer]
+        try:
+            codec = (ext, *factory()) if factory else (ext, None, None)
+        except ImportError as e:
+            logger.warning('Cache serializer %s not available (%s), using plain pickle', serializer, e)
+            codec = ('pickle', None, None)
+        _codecs[serializer] = codec
+    return codec
+
+
+class ArrowFramesFile:
+    """
+    Lists of DataFrames as Arrow IPC streams in a single file, read back memory-mapped.
+
+    Layout: magic, 8 byte little-endian header length, pickled header (envelope meta and (offset, length) of each
+    frame), frames at 64 byte aligned offsets. Each frame is an uncompressed Arrow IPC file, so numeric columns
+    map straight to the page cache.
+    """
+    magic = b'DSLIBFRAMES1\n'
+
+    @staticmethod
+    def frames_of(obj):
+        """
+        :return: (frames, meta) if `obj` is a list of DataFrames or a (list of DataFrames, expiry) cache envelope,
+            otherwise None
+        """
+        pd = sys.modules.get('pandas')
+        if pd is None:
+            return None
+
+        def _is_frames(v):
+            return isinstance(v, list) and all(isinstance(df, pd.DataFrame) for df in v)
+
+        if _is_frames(obj):
+            return obj, dict(envelope=False)
+        if isinstance(obj, tuple) and len(obj) == 2 and _is_frames(obj[0]):
+            return obj[0], dict(envelope=True, meta=obj[1])
+        return None
+
+    @staticmethod
+    def _to_table(df):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        # tabula frames have mixed object columns, only keep what round-trips exactly
+        if not table.to_pandas().equals(df):
+            raise ValueError('DataFrame does not round-trip through arrow')
+        return table
+
+    @classmethod
+    def write(cls, fn, frames, meta):
+        import pyarrow as pa
+        bufs = []
+        for df in frames:
+            sink = pa.BufferOutputStream()
+            table = cls._to_table(df)
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            bufs.append(sink.getvalue())
+
+        def _header(base):
+            offsets, off = [], base
+            for b in bufs:
+                offsets.append((off, b.size))
+                off += -(-b.size // 64) * 64
+            return pickle.dumps(dict(meta, frames=offsets), pickle.HIGHEST_PROTOCOL)
+
+        # the header holds the offsets, its own length shifts them, iterate until stable
+        base = 0
+        while True:
+            header = _header(base)
+            start = -(-(len(cls.magic) + 8 + len(header)) // 64) * 64
+            if start == base:
+                break
+            base = start
+
+        with open(fn, 'wb') as fh:
+            fh.write(cls.magic)
+            fh.write(len(header).to_bytes(8, 'little'))
+            fh.write(header)
+            for b in bufs:
+                fh.write(b'\0' * (-fh.tell() % 64))
+                fh.write(b)
+
+    @classmethod
+    def read(cls, fn):
+        import pyarrow as pa
+        source = pa.memory_map(fn)
+        buf = source.read_buffer()
+        n = len(cls.magic)
+        if buf[:n].to_pybytes() != cls.magic:
+            raise ValueError('not an arrow frames file: %s' % fn)
+        header_len = int.from_bytes(buf[n:n + 8].to_pybytes(), 'little')
+        header = pickle.loads(buf[n + 8:n + 8 + header_len].to_pybytes())
+        frames = [pa.ipc.open_file(buf.slice(off, size)).read_all().to_pandas() for off, size in header['frames']]
+        return (frames, header['meta']) if header['envelope'] else frames
+
+
 class PickleFileStore:
-    def __init__(self):
-        pass
+    """
+    :param serializer: 'pickle', 'lz4' or 'zstd' (compressed pickles) or 'arrow' (lists of DataFrames in
+        memory-mapped Arrow IPC, other values as lz4 pickles). Entries written by another serializer are read too.
+    """
+
+    def __init__(self, serializer='pickle'):
+        assert serializer == 'arrow' or serializer in pickle_codecs, serializer
+        self.serializer = serializer
+
+    def _pickle_codec(self):
+        return _get_codec('lz4' if self.serializer == 'arrow' else self.serializer)
+
+    def _read_exts(self):
+        # own format first
+        exts = ['arrows'] if self.serializer == 'arrow' else []
+        exts.append(self._pickle_codec()[0])
+        for ext in [ext for ext, _ in pickle_codecs.values()] + ['arrows']:
+            if ext not in exts:
+                exts.append(ext)
+        return exts
 
     # noinspection PyMethodMayBeStatic
     def read(self, key):
         # noinspection PyBroadException
         try:
-            fn = _get_fn(key, ext='pickle')
-            with open(fn, 'rb') as fh:
-                ret = pickle.load(fh)
-            touch(fn)
-            return ret
+            for ext in self._read_exts():
+                fn = _get_fn(key, ext=ext)
+                try:
+                    if ext == 'arrows':
+                        ret = ArrowFramesFile.read(fn)
+                    else:
+                        with open(fn, 'rb') as fh:
+                            data = fh.read()
+                        if ext != 'pickle':
+                            data = _get_codec(_ext_serializer[ext])[2](data)
+                        ret = pickle.loads(data)
+                except FileNotFoundError:
+                    continue
+                touch(fn)
+                return ret
         except:
-            return None
+            pass
+        return None
 
     # noinspection PyMethodMayBeStatic
     def write(self, key, df):
         assert isinstance(key, str)
-        fn = _get_fn(key, ext='pickle')
         s = f'.{random_str(6)}.tmp'
+
+        if self.serializer == 'arrow':
+            frames_meta = ArrowFramesFile.frames_of(df)
+            if frames_meta is not None:
+                fn = _get_fn(key, ext='arrows')
+                try:
+                    ArrowFramesFile.write(fn + s, *frames_meta)
+                    os.replace(fn + s, fn)
+                    return
+                except (ImportError, ValueError, TypeError) as e:
+                    # pyarrow.ArrowException subclasses ValueError/TypeError
+                    logger.debug('Arrow serialization failed for %s (%s), using pickle', key, e)
+                    os.path.exists(fn + s) and os.unlink(fn + s)
+
+        ext, compress, _ = self._pickle_codec()
+        fn = _get_fn(key, ext=ext)
+        data = pickle.dumps(df, pickle.HIGHEST_PROTOCOL)
+        if compress:
+            data = compress(data)
         with open(fn + s, 'wb') as fh:
-            pickle.dump(df, fh, pickle.HIGHEST_PROTOCOL)
+            fh.write(data)
         os.replace(fn + s, fn)
         # _set_df_file_store_mtime(fn, df)
 
     def delete(self, key):
-        fn = _get_fn(key, ext='pickle')
-        os.path.exists(fn) and os.unlink(fn)
+        for ext in self._read_exts():
+            fn = _get_fn(key, ext=ext)
+            os.path.exists(fn) and os.unlink(fn)
 
 
 class NoDataException(Exception):
@@ -278,7 +469,7 @@ def to_hashable(obj):
     if isinstance(obj, (list, tuple)):
         return tuple(map(to_hashable, obj))
 
-    if isinstance(obj, (Streaming, NDFrame)):
+    if _is_frame_like(obj):
         return type(obj), id(obj)
 
     raise ValueError(
@@ -286,6 +477,15 @@ def to_hashable(obj):
         % obj)
 
 
+def _is_frame_like(obj):
+    # an object can only be a pandas/streamz instance if the module was imported already
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(obj, (pd.Series, pd.DataFrame)):
+        return True
+    sc = sys.modules.get('streamz.collection')
+    return sc is not None and isinstance(obj, sc.Streaming)
+
+
 def is_hashable(obj):
     # noinspection PyBroadException
     try:
@@ -296,64 +496,176 @@ def is_hashable(obj):
 
 
 class ManagedMemCache(CacheStorage):
-    def __init__(self):
-        self.cache = {}
+    """
+    In-process cache with ttl expiry and an optional size bound.
+
+    When `max_entries` or `max_bytes` is exceeded on `set`, entries are evicted one by one, least recently used
+    (policy='lru') or least frequently used (policy='lfu', least recently used among equal counts) first. Room for
+    a new entry is made before it is inserted, so it is not evicted by its own insert. Entry sizes are estimated once
+    on insert (see `approx_sizeof`) and summed up incrementally.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, policy='lru',
+                 sizeof: Callable = None, housekeeping=True):
+        assert policy in {'lru', 'lfu'}, policy
+        self.cache = OrderedDict()  # key -> (value, expire_at), oldest access first
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._sizeof = sizeof or approx_sizeof
+        self._sizes = {}
+        self._freq = {}  # key -> access count
+        self._buckets = {}  # access count -> OrderedDict of keys, oldest first (lfu eviction in O(1))
+        self._min_freq = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
         self._lock = RLock()
         self._now = now()
+        self._housekeeping = housekeeping
         self._housekeeping_thread: Optional[Thread] = None
-        self._start_housekeeping()
 
     def _start_housekeeping(self):
-        assert self._housekeeping_thread is None, "Housekeeping thread already running"
-        self._housekeeping_thread = Thread(target=self._housekeeping, name='MemCacheHousekeeping', daemon=True)
-        self._housekeeping_thread.start()
+        # started with the first `set`, an unused cache costs no thread
+        with self._lock:
+            if self._housekeeping_thread is not None:
+                return
+            self._housekeeping_thread = Thread(target=self._housekeeping_loop, name='MemCacheHousekeeping',
+                                               daemon=True)
+            self._housekeeping_thread.start()
 
     def __getstate__(self):
         state = self.__dict__.copy()
-        state.pop('lock', None)
-        state.pop('housekeeping_thread', None)
+        state.pop('_lock', None)
+        state.pop('_housekeeping_thread', None)
         return state
 
     def __setstate__(self, state):
-        assert not state.get('lock')
-        assert not state.get('housekeeping_thread')
+        assert not state.get('_lock')
+        assert not state.get('_housekeeping_thread')
         self.__dict__.update(state)
         self._lock = RLock()
-        self._start_housekeeping()
+        self._housekeeping_thread = None
 
-    def _housekeeping(self):
+    def _housekeeping_loop(self):
+        import psutil
         while True:
             _now = now()
             self._now = _now + datetime.timedelta(seconds=15)
-            with self._lock:
-                for key, (value, expire_at) in list(self.cache.items()):
-                    if _now > expire_at:
-                        del self.cache[key]
 
-                mem_usage_percent = psutil.virtual_memory().percent
-                if mem_usage_percent > 92 and len(self.cache):
-                    logger.warning('High memory usage %.1f', mem_usage_percent)
-                    self.clear()
-                    time.sleep(120)
+            # expire in small batches, readers only wait for one batch
+            with self._lock:
+                keys = list(self.cache.keys())
+            for i in range(0, len(keys), 1000):
+                with self._lock:
+                    for key in keys[i:i + 1000]:
+                        got = self.cache.get(key)
+                        if got is not None and _now > got[1]:
+                            self._remove(key)
+                            self.expirations += 1
+
+            mem_usage_percent = psutil.virtual_memory().percent
+            if mem_usage_percent > 92 and len(self.cache):
+                # shed the colder half of the cache instead of clearing it all
+                logger.warning('High memory usage %.1f, evicting %d of %d entries', mem_usage_percent,
+                               len(self.cache) // 2 + 1, len(self.cache))
+                for _ in range(len(self.cache) // 2 + 1):
+                    with self._lock:
+                        if not self._evict_one():
+                            break
 
             time.sleep(30)
 
+    def _touch(self, key):
+        f = self._freq.get(key, 0)
+        if f:
+            bucket = self._buckets[f]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[f]
+                if self._min_freq == f:
+                    self._min_freq = f + 1
+        else:
+            self._min_freq = 1
+        self._freq[key] = f + 1
+        self._buckets.setdefault(f + 1, OrderedDict())[key] = None
+
+    def _remove(self, key):
+        del self.cache[key]
+        self._bytes -= self._sizes.pop(key, 0)
+        f = self._freq.pop(key, None)
+        if f:
+            bucket = self._buckets[f]
+            del bucket[key]
+            if not bucket:
+                # _min_freq may point to this bucket now, resolved on the next eviction
+                del self._buckets[f]
+
+    def _evict_one(self, keep=None):
+        """
+        :param keep: don't evict this key
+        """
+        if not self.cache:
+            return False
+        if self.policy == 'lfu':
+            if self._min_freq not in self._buckets:
+                self._min_freq = min(self._buckets)
+            key = next((k for k in self._buckets[self._min_freq] if k != keep), None)
+            if key is None:
+                # `keep` is the only key with the lowest count
+                key = next(iter(self._buckets[min(f for f in self._buckets if f != self._min_freq)]))
+        else:
+            key = next(k for k in self.cache if k != keep)
+        self._remove(key)
+        self.evictions += 1
+        return True
+
+    def _over_budget(self, extra_entries=0, extra_bytes=0):
+        return ((self.max_entries is not None and len(self.cache) + extra_entries > self.max_entries)
+                or (self.max_bytes is not None and self._bytes + extra_bytes > self.max_bytes))
+
     def set(self, key, value, ttl, ignore_overwrite=False):
+        if self._housekeeping_thread is None and self._housekeeping:
+            self._start_housekeeping()
         if not isinstance(ttl, datetime.timedelta):
-            ttl = pd.to_timedelta(ttl)
+            ttl = to_timedelta(ttl)
+        size = self._sizeof(value) if self.max_bytes is not None else 0
         with self._lock:
             if not ignore_overwrite and key in self.cache and now() < self.cache[key][1] and value is not None:
-                t = threading.currentThread()
+                t = threading.current_thread()
                 logger.warning(
                     'MMC: overwrite key %s expiring at %s (in %s) (cache might be inefficient due to race condition in thread %s#%s)',
                     key, self.cache[key][1], (self.cache[key][1] - now()), t.name, t.ident)
+            if key in self.cache:
+                self._bytes -= self._sizes.get(key, 0)
+                self.cache.move_to_end(key)
+            else:
+                while self._over_budget(1, size) and self.cache:
+                    self._evict_one()
             self.cache[key] = (value, now() + ttl)
+            self._sizes[key] = size
+            self._bytes += size
+            self._touch(key)
+            # overwrite with a larger value
+            while self._over_budget() and len(self.cache) > 1:
+                self._evict_one(keep=key)
 
     def get(self, key):
         with self._lock:
             got = self.cache.get(key)
-        if got is None or got[1] <= now():
-            return None
+            if got is None:
+                self.misses += 1
+                return None
+            if got[1] <= now():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            self._touch(key)
         return got[0]
 
     def get_default(self, key, default, ttl):
@@ -366,31 +678,39 @@ class ManagedMemCache(CacheStorage):
 
     def clear(self):
         with self._lock:
-            mb = (self.size_bytes() / 1e6) if self.cache else 0
+            mb = self._bytes / 1e6
             if mb > 1:
                 logger.info('Clearing mem cache (size=%.1fMB)', mb)
-            if mb > 0:
-                self.cache.clear()
-                import gc
-                gc.collect()
+            self.cache.clear()
+            self._sizes.clear()
+            self._freq.clear()
+            self._buckets.clear()
+            self._bytes = 0
 
     def __delitem__(self, key):
         with self._lock:
-            del self.cache[key]
+            self._remove(key)
 
     def size_bytes(self):
-        from pympler import asizeof
-        return asizeof.asizeof(self.cache)
+        """
+        :return: estimated size of cached values, only accounted if `max_bytes` is set
+        """
+        return self._bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(entries=len(self.cache), bytes=self._bytes, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, expirations=self.expirations)
 
     def __getitem__(self, item):
-        # TODO add locking?
-        if item not in self:
-            raise KeyError(item)
-        return self.cache[item][0]
+        with self._lock:
+            if item not in self:
+                raise KeyError(item)
+            return self.cache[item][0]
 
     def __contains__(self, item):
-        # TODO add locking?
-        return item in self.cache and self.cache[item][1] >= now()
+        with self._lock:
+            return item in self.cache and self.cache[item][1] >= now()
 
     def print_stats(self):
         from pympler import asizeof
@@ -400,33 +720,96 @@ class ManagedMemCache(CacheStorage):
         for key, (value, expire_at) in items:
             size_by_key[key] = asizeof.asizeof(value)
 
-        cache_size = asizeof.asizeof(self.cache)
-        print('ManagedMemCache size by key (total = %.1fMB):' % cache_size / 1e6)
+        print('ManagedMemCache %s' % self.stats())
+        print('ManagedMemCache size by key (total = %.1fMB):' % (sum(size_by_key.values()) / 1e6))
         for key, size in sorted(size_by_key.items(), key=lambda kv: kv[1], reverse=True)[:20]:
-            print('%20s: %8.1fkB' % (key[:20], size / 1e3))
+            print('%20s: %8.1fkB' % (str(key)[:20], size / 1e3))
+
+
+def approx_sizeof(value) -> int:
+    """
+    Cheap size estimate of a cache value: DataFrame/ndarray buffers, str/bytes length and one level of
+    containers. Much faster than a full object graph walk (pympler), good enough for a cache budget.
+    """
+    if hasattr(value, 'memory_usage') and hasattr(value, 'columns'):  # DataFrame
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if hasattr(value, 'nbytes'):  # ndarray, Series
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approx_sizeof(v) if hasattr(v, 'nbytes') else sys.getsizeof(v)
+                                          for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
 
 
 _managed_mem_cache = None
 
+# bound of the shared mem cache
+shared_mem_cache_max_bytes = 512 * 1024 * 1024
+
 
 def shared_managed_mem_cache() -> ManagedMemCache:
     global _managed_mem_cache
     if _managed_mem_cache is None:
-        _managed_mem_cache = ManagedMemCache()
+        _managed_mem_cache = ManagedMemCache(max_bytes=shared_mem_cache_max_bytes)
     return _managed_mem_cache
 
 
-def disk_cache_key(mod, target, ignore_kwargs, args, kwargs):
-    # TODO    target.__code__
-    kwargs_cache = {k: v for k, v in kwargs.items() if k not in ignore_kwargs}
-    cache_key_obj = (to_hashable(args), to_hashable(kwargs_cache))
-    cache_key_hash = hashlib.sha224(bytes(str(cache_key_obj), 'utf-8')).hexdigest()
+def stable_repr(obj) -> str:
+    """
+    Deterministic text of a (nested) argument for cache key hashing. Same equivalences as `to_hashable`:
+    lists and tuples are alike, dicts and sets are sorted.
+    """
+    t = type(obj)
+    if t is str or t is int or t is float or t is bool or obj is None or t is bytes:
+        return repr(obj)
+    if t is tuple or t is list:
+        return '(' + ','.join(map(stable_repr, obj)) + ',)'
+    if isinstance(obj, dict):
+        return '{' + ','.join(sorted(stable_repr(k) + ':' + stable_repr(v) for k, v in obj.items())) + '}'
+    if isinstance(obj, (set, frozenset)):
+        return '{' + ','.join(sorted(map(stable_repr, obj))) + ',}'
+    return str(to_hashable(obj))
+
+
+def key_digest(s: str) -> str:
+    return hashlib.blake2b(s.encode('utf-8'), digest_size=20).hexdigest()
 
-    mod_file = mod.__file__.replace('__mp_main__', '__main__')
-    path_hash = hashlib.sha224(bytes(mod_file, 'utf-8')).hexdigest()[:4]
 
-    cache_key_str = '/'.join([mod_file, path_hash, target.__name__, cache_key_hash])
-    return cache_key_str
+def code_fingerprint(*objs) -> str:
+    """
+    Short hash of the source code of modules, classes and functions (and the repr of plain values such as regex
+    tables), for `disk_cache(salt=...)`. Source text rather than byte code, so it is the same across python versions.
+    """
+    import inspect
+    parts = []
+    for obj in objs:
+        if inspect.ismodule(obj) or inspect.isclass(obj) or callable(obj):
+            parts.append(inspect.getsource(obj))
+        else:
+            parts.append(stable_repr(obj))
+    return key_digest('\0'.join(parts))[:12]
+
+
+def disk_cache_key_prefix(mod, target) -> str:
+    """
+    Location independent identity of a function, e.g. 'dslib/pdf2txt/parse/extract_text'. Functions of the main
+    script are named by the script file name.
+    """
+    mod_name = mod.__name__
+    if mod_name in {'__main__', '__mp_main__'}:
+        mod_name = os.path.splitext(os.path.basename(mod.__file__))[0]
+    return '/'.join(mod_name.split('.') + [target.__qualname__.replace('<locals>', 'locals')])
+
+
+def disk_cache_key(mod, target, ignore_kwargs, args, kwargs, prefix: str = None):
+    """
+    :param prefix: `disk_cache_key_prefix(mod, target)`, pass it in if precomputed
+    """
+    kwargs_cache = {k: v for k, v in kwargs.items() if k not in ignore_kwargs}
+    cache_key_hash = key_digest(stable_repr((args, kwargs_cache)))
+    return (prefix or disk_cache_key_prefix(mod, target)) + '/' + cache_key_hash
 
 
 def fallback_cache(exception=None, ignore_kwargs=None):
@@ -439,11 +822,12 @@ def fallback_cache(exception=None, ignore_kwargs=None):
     def decorate(target):
         import inspect
         mod = inspect.getmodule(target)
+        prefix = disk_cache_key_prefix(mod, target)
 
         # noinspection PyBroadException
         @wraps(target)
         def _fallback_cache_wrapper(*args, **kwargs):
-            cache_key_str = disk_cache_key(mod, target, ignore_kwargs, args=args, kwargs=kwargs)
+            cache_key_str = disk_cache_key(mod, target, ignore_kwargs, args=args, kwargs=kwargs, prefix=prefix)
 
             try:
                 ret = target(*args, **kwargs)
@@ -468,27 +852,119 @@ def fallback_cache(exception=None, ignore_kwargs=None):
     return decorate
 
 
+class _Flight:
+    __slots__ = ('done', 'owner', 'result', 'exc')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result = None
+        self.exc = None
+
+
+# result of an async flight whose leader was cancelled
+_RETRY = object()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (leader) runs the function, callers arriving
+    while it is in flight wait and receive the leader's result or exception. Nothing is kept once the call finished.
+
+    `do` serves threads, `do_async` coroutines (one flight per event loop and key). If the leading coroutine is
+    cancelled, a waiter runs the function again instead of seeing the cancellation.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+        self._async_flights = {}
+
+    def do(self, key, fn: Callable):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.owner == threading.get_ident():
+                # re-entrant call of the leader itself, waiting would dead-lock
+                return fn()
+            flight.done.wait()
+            if flight.exc is not None:
+                raise flight.exc
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.exc = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, coro_fn: Callable):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        fkey = (loop, key)
+        while True:
+            fut = self._async_flights.get(fkey)
+            if fut is None:
+                break
+            # shield, a cancelled waiter must not cancel the leader's result for everybody else
+            ret = await asyncio.shield(fut)
+            if ret is not _RETRY:
+                return ret
+            # the leader was cancelled, the first waiter to get here leads the next flight
+
+        fut = self._async_flights[fkey] = loop.create_future()
+        try:
+            ret = await coro_fn()
+            fut.set_result(ret)
+            return ret
+        except asyncio.CancelledError:
+            # only the leader's caller is cancelled, the waiters retry
+            fut.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved, no "never retrieved" log if there are no waiters
+            raise
+        finally:
+            del self._async_flights[fkey]
+
+    def __len__(self):
+        return len(self._flights) + len(self._async_flights)
+
+
 # noinspection PyShadowingNames
 def mem_cache(ttl, touch=False, ignore_kwargs=None, synchronized=False, expired=None, ignore_rc=False,
-              cache_storage: CacheStorage = shared_managed_mem_cache(),
+              cache_storage: CacheStorage = None,
               key_func: Callable = None):
     """
-    Decorator
+    Decorator, works with functions and coroutine functions.
     :param touch: touch key time on hit
     :param ttl:
     :param ignore_kwargs: a set of keyword arguments to ignore when building the cache key
+    :param synchronized: single-flight, concurrent misses of the same key (threads or coroutines) wait for one
+        computation and all get its result or exception
     :param expired Callable to evaluate whether the cached value has expired/invalidated
+    :param cache_storage: defaults to the shared ManagedMemCache
     :return:
     """
 
     if ignore_kwargs is None:
         ignore_kwargs = set()
 
-    ttl = pd.to_timedelta(ttl)
-    _mem_cache = cache_storage
-    _lock_cache = shared_managed_mem_cache()
+    ttl = to_timedelta(ttl)
+    _mem_cache = cache_storage or shared_managed_mem_cache()
 
     def decorate(target):
+        import inspect
 
         if key_func:
             def _cache_key_obj(args, kwargs):
@@ -498,65 +974,165 @@ def mem_cache(ttl, touch=False, ignore_kwargs=None, synchronized=False, expired=
                 kwargs_cache = {k: v for k, v in kwargs.items() if k not in ignore_kwargs}
                 return (target, to_hashable(args), to_hashable(kwargs_cache))
 
-        @wraps(target)
-        def _inner_wrapper(cache_key_obj, args, kwargs):
+        def _lookup(cache_key_obj):
             ret = _mem_cache.get(cache_key_obj)
 
             if expired and ret is not None and expired(ret):
                 del _mem_cache[cache_key_obj]
                 ret = None
 
-            if ret is None:
-                ret = target(*args, **kwargs)
-                _mem_cache.set(cache_key_obj, ret, ttl=ttl, ignore_overwrite=ignore_rc)
-            elif touch:
+            if ret is not None and touch:
                 _mem_cache.set(cache_key_obj, ret, ttl=ttl, ignore_overwrite=True)
 
             return ret
 
-        if synchronized:
-            target_lock = Lock()
+        def _store(cache_key_obj, ret):
+            _mem_cache.set(cache_key_obj, ret, ttl=ttl, ignore_overwrite=ignore_rc or synchronized)
+            return ret
+
+        flights = SingleFlight() if synchronized else None
 
+        if inspect.iscoroutinefunction(target):
             @wraps(target)
-            def _mem_cache_synchronized_wrapper(*args, **kwargs):
+            async def _mem_cache_async_wrapper(*args, **kwargs):
                 cache_key_obj = _cache_key_obj(args, kwargs)
+                ret = _lookup(cache_key_obj)
+                if ret is not None:
+                    return ret
 
-                with target_lock:
-                    lock = _lock_cache.get_default((cache_key_obj, target_lock), Lock, ttl=ttl)
+                async def _compute():
+                    # a flight that just landed might have filled the cache
+                    ret = _lookup(cache_key_obj) if flights is not None else None
+                    if ret is None:
+                        ret = _store(cache_key_obj, await target(*args, **kwargs))
+                    return ret
 
-                with lock:
-                    return _inner_wrapper(cache_key_obj, args, kwargs)
+                if flights is not None:
+                    return await flights.do_async(cache_key_obj, _compute)
+                return await _compute()
 
-            return _mem_cache_synchronized_wrapper
+            _mem_cache_async_wrapper.flights = flights
+            return _mem_cache_async_wrapper
 
-        else:
-            @wraps(target)
-            def _mem_cache_wrapper(*args, **kwargs):
-                cache_key_obj = _cache_key_obj(args, kwargs)
-                return _inner_wrapper(cache_key_obj, args, kwargs)
+        @wraps(target)
+        def _mem_cache_wrapper(*args, **kwargs):
+            cache_key_obj = _cache_key_obj(args, kwargs)
+            ret = _lookup(cache_key_obj)
+            if ret is not None:
+                return ret
+
+            if flights is not None:
+                def _compute():
+                    ret = _lookup(cache_key_obj)
+                    if ret is None:
+                        ret = _store(cache_key_obj, target(*args, **kwargs))
+                    return ret
+
+                return flights.do(cache_key_obj, _compute)
+
+            return _store(cache_key_obj, target(*args, **kwargs))
 
-            return _mem_cache_wrapper
+        _mem_cache_wrapper.flights = flights
+        return _mem_cache_wrapper
 
     return decorate
 
 
-def disk_cache(ttl, ignore_kwargs=None, file_dependencies=None, salt=None):
+_realpaths = {}
+_stat_cache: Optional[dict] = None
+
+
+@contextmanager
+def dependency_stat_cache():
+    """
+    Within the block each dependency file of all `disk_cache` functions is stat'ed only once, e.g. for a batch run
+    over many datasheets. Files must not change during the block (changes are not seen until it exits).
+    Nested blocks share the outermost cache.
+    """
+    global _stat_cache
+    outer = _stat_cache
+    if outer is None:
+        _stat_cache = {}
+    try:
+        yield
+    finally:
+        if outer is None:
+            _stat_cache = None
+
+
+_content_digests = {}
+
+
+def file_digest(path) -> str:
+    """
+    Content hash of a file, memoized per process by (real path, size, mtime). Stat'ed once inside
+    `dependency_stat_cache`. Resolved real paths are remembered for the process lifetime, `os.path.realpath` walks
+    every path component.
+    """
+    rp = _realpaths.get(path)
+    if rp is None:
+        rp = _realpaths[path] = os.path.realpath(path)
+
+    stat_cache = _stat_cache
+    st = stat_cache.get(rp) if stat_cache is not None else None
+    if st is None:
+        st = os.stat(rp)
+        st = (st.st_size, st.st_mtime_ns)
+        if stat_cache is not None:
+            stat_cache[rp] = st
+
+    memo_key = (rp, *st)
+    digest = _content_digests.get(memo_key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=20)
+        with open(rp, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _content_digests[memo_key] = h.hexdigest()
+    return digest
+
+
+def disk_cache(ttl, ignore_kwargs=None, file_dependencies=None, salt=None, mem_entries=64, serializer='pickle'):
+    """
+    Decorator, caches return values in pickle files below `cache_dir`.
+    :param ttl:
+    :param ignore_kwargs: a set of keyword arguments to ignore when building the cache key
+    :param file_dependencies: arguments (positional index or keyword name) that are file paths. The key holds the
+        file content hash instead of the path, so the cache is valid across checkouts and machines.
+        True is the same as [0]
+    :param salt: bump to invalidate existing cache entries. Can be a callable (e.g. returning a `code_fingerprint`
+        of the code the result depends on), evaluated once on first use
+    :param mem_entries: size of the in-process memory tier in front of the disk (keyed identically), 0 disables it.
+        Memory hits return the same object to each caller, so don't mutate return values.
+    :param serializer: file format, see `PickleFileStore`
+    :return:
+    """
     if ignore_kwargs is None:
         ignore_kwargs = set()
 
-    disk_cache_store = PickleFileStore()
-    ttl = pd.to_timedelta(ttl)
+    disk_cache_store = PickleFileStore(serializer=serializer)
+    ttl = to_timedelta(ttl)
+
+    fd_arg_names = file_dependencies
+    if isinstance(fd_arg_names, bool):
+        fd_arg_names = [0] if fd_arg_names else None
+
+    _salt = []
+
+    def _get_salt():
+        if not _salt:
+            _salt.append(salt() if callable(salt) else salt)
+        return _salt[0]
 
     def decorate(target):
         import inspect
         mod = inspect.getmodule(target)
+        prefix = disk_cache_key_prefix(mod, target)
+        mem_tier = ManagedMemCache(max_entries=mem_entries, housekeeping=False) if mem_entries else None
 
         def _cache_key(*args, **kwargs):
-            mtimes = {}
-            if file_dependencies:
-                fd_arg_names = file_dependencies
-                if isinstance(fd_arg_names, bool) and fd_arg_names == True:
-                    fd_arg_names = [0]
+            if fd_arg_names:
+                args, kwargs = list(args), dict(kwargs)
                 for arg_name in fd_arg_names:
                     if isinstance(arg_name, int):
                         arg_val = args[arg_name] if arg_name < len(args) else None
@@ -564,37 +1140,75 @@ def disk_cache(ttl, ignore_kwargs=None, file_dependencies=None, salt=None):
                         arg_val = kwargs.get(arg_name)
                     if arg_val is None:
                         return None
-                    arg_val = os.path.realpath(arg_val)
-                    mtimes['__mtime:' + arg_val] = os.path.getmtime(arg_val)
+                    digest = 'file:' + file_digest(arg_val)
+                    if isinstance(arg_name, int):
+                        args[arg_name] = digest
+                    else:
+                        kwargs[arg_name] = digest
             if salt is not None:
-                mtimes['__salt__'] = salt
-            cache_key_str = disk_cache_key(mod, target, ignore_kwargs, args=args, kwargs={**kwargs, **mtimes})
+                kwargs = {**kwargs, '__salt__': _get_salt()}
+            cache_key_str = disk_cache_key(mod, target, ignore_kwargs, args=args, kwargs=kwargs, prefix=prefix)
             return cache_key_str
 
         def _invalidate(*args, **kwargs):
             cache_key_str = _cache_key(*args, **kwargs)
             if cache_key_str is None:
                 return
+            if mem_tier is not None and cache_key_str in mem_tier:
+                del mem_tier[cache_key_str]
             disk_cache_store.delete(cache_key_str)
 
+        def _cached(*args, **kwargs) -> bool:
+            """
+            Whether the call is a cache hit, without running it. A disk hit is loaded into the memory tier.
+            """
+            cache_key_str = _cache_key(*args, **kwargs)
+            if cache_key_str is None:
+                return False
+            if mem_tier is not None and mem_tier.get(cache_key_str) is not None:
+                return True
+            try:
+                cache_val = disk_cache_store.read(cache_key_str)
+            except Exception:
+                return False
+            if cache_val is None or now() > cache_val[1]:
+                return False
+            if mem_tier is not None:
+                mem_tier.set(cache_key_str, cache_val, ttl=cache_val[1] - now(), ignore_overwrite=True)
+            return True
+
         # noinspection PyBroadException
         @wraps(target)
         def _disk_cache_wrapper(*args, **kwargs):
             cache_key_str = _cache_key(*args, **kwargs)
             if cache_key_str is None:
                 return target(*args, **kwargs)
+
+            if mem_tier is not None:
+                cache_val = mem_tier.get(cache_key_str)
+                if cache_val is not None:
+                    return cache_val[0]
+
             try:
                 cache_val = disk_cache_store.read(cache_key_str)
                 if cache_val is not None:
                     ret, exp = cache_val
-                    if now() <= exp:
+                    _now = now()
+                    if _now <= exp:
+                        if mem_tier is not None:
+                            mem_tier.set(cache_key_str, cache_val, ttl=exp - _now, ignore_overwrite=True)
                         return ret
             except Exception as _e:
                 logger.warning("Disk cache error reading %s: %s", cache_key_str, _e)
 
             ret = target(*args, **kwargs)
+            exp = now() + ttl
+            if not ran_housekeeping and os.environ.get('DSLIB_CACHE_BUDGET'):
+                _disk_cache_housekeeping()
+            if mem_tier is not None:
+                mem_tier.set(cache_key_str, (ret, exp), ttl=ttl, ignore_overwrite=True)
             try:
-                disk_cache_store.write(cache_key_str, (ret, now() + ttl))
+                disk_cache_store.write(cache_key_str, (ret, exp))
             except Exception as _e:
                 logger.warning('Disk cache: error storing: %s', _e)
                 pass
@@ -602,9 +1216,60 @@ def disk_cache(ttl, ignore_kwargs=None, file_dependencies=None, salt=None):
             return ret
 
         _disk_cache_wrapper.invalidate = _invalidate
+        _disk_cache_wrapper.cached = _cached
+        _disk_cache_wrapper.mem_tier = mem_tier
         return _disk_cache_wrapper
 
     return decorate
 
 
-init_cache()
+def tests():
+    # lfu: a new key gets in, and once hot survives the next inserts
+    c = ManagedMemCache(max_entries=3, policy='lfu', housekeeping=False)
+    for k in 'abc':
+        c.set(k, k, ttl='1h')
+        c.get(k)
+    c.get('a')
+    c.set('hot', 1, ttl='1h')
+    assert c.get('hot') == 1 and 'b' not in c.cache, list(c.cache)
+    for _ in range(5):
+        c.get('hot')
+    for k in 'xyz':
+        c.set(k, k, ttl='1h')
+        assert c.get(k) == k
+    assert c.get('hot') == 1 and c.get('a') == 'a' and len(c.cache) == 3, list(c.cache)
+    assert c._min_freq == min(c._buckets) and sum(map(len, c._buckets.values())) == 3
+
+    # a cancelled leader hands the flight over to a waiter
+    import asyncio
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(.05)
+        return len(calls)
+
+    async def run():
+        sf = SingleFlight()
+        leader = asyncio.create_task(sf.do_async('k', compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(sf.do_async('k', compute)) for _ in range(2)]
+        await asyncio.sleep(.01)
+        leader.cancel()
+        assert await asyncio.gather(*waiters) == [2, 2] and leader.cancelled() and not len(sf)
+
+    asyncio.run(run())
+
+    # lru and the byte budget
+    c = ManagedMemCache(max_bytes=100, sizeof=len, housekeeping=False)
+    c.set('a', 'x' * 40, ttl='1h')
+    c.set('b', 'x' * 40, ttl='1h')
+    c.get('a')
+    c.set('c', 'x' * 40, ttl='1h')
+    assert list(c.cache) == ['a', 'c'] and c.size_bytes() == 80
+    c.set('a', 'x' * 90, ttl='1h', ignore_overwrite=True)
+    assert list(c.cache) == ['a'] and c.size_bytes() == 90
+
+
+if __name__ == '__main__':
+    tests()
@@ -0,0 +1,386 @@
+"""
+Disk cache maintenance: a size index of all cache files below `cache.cache_dir` (all stores, recursive), disk budget
+enforcement by LRU eviction and max-age pruning. Runs incrementally in a background thread or from the command line:
+
+    python -m dslib.cache_maint stats
+    python -m dslib.cache_maint prune --budget 20G --max-age 120d
+    python -m dslib.cache_maint prune --budget 5G --dry-run
+
+The index is an sqlite db in the cache dir (path, store, size, mtime). Dot files (the index, the failure
+registry) are not cache entries. Reads touch cache files, so mtime is the
+last access time. Before an indexed file is evicted it is stat'ed again, recently used files are kept.
+
+Background maintenance starts with the first influx cache read or, if DSLIB_CACHE_BUDGET (e.g. '20G') is set,
+with the first disk_cache write. Only in the main process: worker processes (supervisor, OCR pool) write to the
+same cache but leave its maintenance to the parent.
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from dslib import cache, get_logger
+
+logger = get_logger()
+
+index_name = '.index.sqlite'
+
+# store -> max age of entries. influx cache files (top level *.pkl) are dropped after a week as before
+default_max_age = dict(influx=datetime.timedelta(days=7))
+
+tmp_max_age = datetime.timedelta(hours=1)
+
+
+def store_of(rel_path) -> str:
+    fn = os.path.basename(rel_path)
+    if fn.endswith('.tmp'):
+        return 'tmp'
+    if fn.endswith('.parquet'):
+        return 'parquet'
+    if fn.endswith('.pkl.gz'):
+        return 'pandas_pickle'
+    if fn.endswith('.pkl') and os.sep not in rel_path:
+        return 'influx'
+    if '.pickle' in fn or fn.endswith('.arrows'):
+        return 'pickle'
+    return 'other'
+
+
+def parse_size(s) -> int:
+    """
+    '20G', '500M', '1.5T' or a number of bytes
+    """
+    if isinstance(s, (int, float)):
+        return int(s)
+    s = s.strip().upper().rstrip('B')
+    mul = dict(K=1 << 10, M=1 << 20, G=1 << 30, T=1 << 40).get(s[-1:], 1)
+    return int(float(s.rstrip('KMGT')) * mul)
+
+
+def fmt_size(n) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n) < 1024:
+            return '%.1f%s' % (n, unit)
+        n /= 1024
+    return '%.1fTB' % n
+
+
+class CacheIndex:
+    """
+    Size/mtime index of the cache files. `scan_step` indexes a few directories per call, so a full pass over a
+    large cache can be spread over time.
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.realpath(root or cache.cache_dir)
+        self.db_path = os.path.join(self.root, index_name)
+        self._lock = threading.RLock()
+        self._con: Optional[sqlite3.Connection] = None
+        self._pending = []
+
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            cache.mkdir_p(self.root)
+            con = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS entries '
+                        '(path TEXT PRIMARY KEY, dir TEXT, store TEXT, size INTEGER, mtime REAL)')
+            con.execute('CREATE INDEX IF NOT EXISTS entries_mtime ON entries (mtime)')
+            con.execute('CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir)')
+            self._con = con
+        return self._con
+
+    def close(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def scan_dir(self, rel_dir) -> list:
+        """
+        Index the files of one directory (not recursive), drop rows of files that are gone.
+        :return: sub directories (relative)
+        """
+        rows, sub_dirs = [], []
+        try:
+            it = os.scandir(os.path.join(self.root, rel_dir))
+        except FileNotFoundError:
+            return []
+        with it:
+            for e in it:
+                rel = os.path.join(rel_dir, e.name) if rel_dir else e.name
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        sub_dirs.append(rel)
+                    elif e.is_file(follow_symlinks=False) and not e.name.startswith('.'):
+                        st = e.stat(follow_symlinks=False)
+                        rows.append((rel, rel_dir, store_of(rel), st.st_size, st.st_mtime))
+                except FileNotFoundError:
+                    pass
+
+        with self._lock:
+            con = self._db()
+            with con:
+                con.execute('CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)')
+                con.execute('DELETE FROM seen')
+                con.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((r[0],) for r in rows))
+                con.execute('DELETE FROM entries WHERE dir = ? AND path NOT IN (SELECT path FROM seen)', (rel_dir,))
+                con.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', rows)
+        return sub_dirs
+
+    def scan_step(self, max_dirs=50) -> bool:
+        """
+        Index up to `max_dirs` directories, breadth first.
+        :return: True if a full pass over the cache dir completed
+        """
+        with self._lock:
+            if not self._pending:
+                self._pending = ['']
+            for _ in range(max_dirs):
+                if not self._pending:
+                    break
+                self._pending.extend(self.scan_dir(self._pending.pop()))
+            return not self._pending
+
+    def scan(self):
+        while not self.scan_step(max_dirs=1000):
+            pass
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        :return: {store: dict(files, bytes, oldest, newest)}, the key 'total' sums up all stores
+        """
+        with self._lock:
+            rows = self._db().execute('SELECT store, COUNT(*), SUM(size), MIN(mtime), MAX(mtime) FROM entries '
+                                      'GROUP BY store').fetchall()
+        stats = {}
+        for store, n, size, oldest, newest in rows:
+            stats[store] = dict(files=n, bytes=size or 0, oldest=oldest, newest=newest)
+        stats['total'] = dict(files=sum(s['files'] for s in stats.values()),
+                              bytes=sum(s['bytes'] for s in stats.values()),
+                              oldest=min((s['oldest'] for s in stats.values()), default=None),
+                              newest=max((s['newest'] for s in stats.values()), default=None))
+        return stats
+
+    def top_dirs(self, n=20) -> list:
+        """
+        :return: [(module dir, files, bytes)] largest first, the cache key prefix is the module path
+        """
+        with self._lock:
+            return self._db().execute('SELECT dir, COUNT(*), SUM(size) s FROM entries GROUP BY dir '
+                                      'ORDER BY s DESC LIMIT ?', (n,)).fetchall()
+
+    def _remove(self, rel, indexed_mtime, dry_run) -> int:
+        """
+        Delete a file unless it was accessed after it was indexed.
+        :return: freed bytes
+        """
+        fn = os.path.join(self.root, rel)
+        con = self._db()
+        try:
+            st = os.stat(fn)
+        except FileNotFoundError:
+            con.execute('DELETE FROM entries WHERE path = ?', (rel,))
+            return 0
+        if st.st_mtime > indexed_mtime + 1:
+            con.execute('UPDATE entries SET mtime = ?, size = ? WHERE path = ?', (st.st_mtime, st.st_size, rel))
+            return 0
+        if not dry_run:
+            try:
+                os.unlink(fn)
+            except FileNotFoundError:
+                pass
+            con.execute('DELETE FROM entries WHERE path = ?', (rel,))
+        return st.st_size
+
+    def prune(self, budget_bytes: Optional[int] = None, max_age: Dict[str, datetime.timedelta] = None,
+              dry_run=False) -> dict:
+        """
+        Drop expired entries, then the least recently used ones until the cache fits into `budget_bytes`.
+        Works on the index, call `scan` (or `scan_step` until done) before.
+        :param budget_bytes: disk budget of all stores together
+        :param max_age: store -> max age since last access, `default_max_age` if None. The key '*' applies to all
+        :param dry_run: only count what would be deleted
+        :return: dict(files, bytes) deleted
+        """
+        if max_age is None:
+            max_age = default_max_age
+        max_age = dict(max_age, tmp=min(max_age.get('tmp', tmp_max_age), tmp_max_age))
+        _now = time.time()
+        n, freed = 0, 0
+
+        with self._lock:
+            con = self._db()
+            with con:
+                for store, age in max_age.items():
+                    if store == '*':
+                        q, params = 'SELECT path, mtime FROM entries WHERE mtime < ?', (_now - age.total_seconds(),)
+                    else:
+                        q = 'SELECT path, mtime FROM entries WHERE store = ? AND mtime < ?'
+                        params = (store, _now - age.total_seconds())
+                    for rel, mtime in con.execute(q, params).fetchall():
+                        b = self._remove(rel, mtime, dry_run)
+                        n += b > 0
+                        freed += b
+
+                if budget_bytes is not None:
+                    total = con.execute('SELECT SUM(size) FROM entries').fetchone()[0] or 0
+                    total -= freed if dry_run else 0
+                    cur = con.execute('SELECT path, mtime FROM entries ORDER BY mtime ASC')
+                    while total > budget_bytes:
+                        batch = cur.fetchmany(500)
+                        if not batch:
+                            break
+                        for rel, mtime in batch:
+                            if total <= budget_bytes:
+                                break
+                            b = self._remove(rel, mtime, dry_run)
+                            n += b > 0
+                            freed += b
+                            total -= b
+
+        if n:
+            logger.info('Cache maintenance %s %d files (%s)', 'would delete' if dry_run else 'deleted', n,
+                        fmt_size(freed))
+        return dict(files=n, bytes=freed)
+
+
+_maintenance_thread: Optional[threading.Thread] = None
+_maintenance_lock = threading.Lock()
+
+
+def budget_from_env() -> Optional[int]:
+    b = os.environ.get('DSLIB_CACHE_BUDGET')
+    return parse_size(b) if b else None
+
+
+def start_background_maintenance(budget_bytes: Optional[int] = None, max_age=None, interval=300,
+                                 dirs_per_step=20):
+    """
+    Keep the index up to date and prune in a daemon thread. Indexes `dirs_per_step` directories per second, prunes
+    after each full pass and then sleeps `interval` seconds. Starts only once, in the main process.
+    :param budget_bytes: defaults to DSLIB_CACHE_BUDGET
+    :return: the thread, None in child processes
+    """
+    global _maintenance_thread
+    if multiprocessing.parent_process() is not None:
+        # one scan/prune thread against the index, the parent's
+        return None
+    with _maintenance_lock:
+        if _maintenance_thread is not None:
+            return _maintenance_thread
+
+        if budget_bytes is None:
+            budget_bytes = budget_from_env()
+
+        def _run():
+            idx = CacheIndex()
+            while True:
+                # noinspection PyBroadException
+                try:
+                    if idx.scan_step(max_dirs=dirs_per_step):
+                        idx.prune(budget_bytes=budget_bytes, max_age=max_age)
+                        time.sleep(interval)
+                    else:
+                        time.sleep(1)
+                except Exception as e:
+                    logger.warning('Cache maintenance error: %s', e)
+                    time.sleep(interval)
+
+        _maintenance_thread = threading.Thread(target=_run, name='CacheMaintenance', daemon=True)
+        _maintenance_thread.start()
+        return _maintenance_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dslib.cache_maint', description='Disk cache maintenance')
+    parser.add_argument('--cache-dir', default=None, help='defaults to %s' % cache.cache_dir)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats', help='index the cache and print size by store and module')
+    p = sub.add_parser('prune', help='delete expired and least recently used entries')
+    p.add_argument('--budget', default=os.environ.get('DSLIB_CACHE_BUDGET'), help="e.g. '20G'")
+    p.add_argument('--max-age', default=None, help="max age of all entries since last access, e.g. '120d'")
+    p.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    idx = CacheIndex(args.cache_dir)
+    t0 = time.time()
+    idx.scan()
+    print('indexed %s in %.1fs' % (idx.root, time.time() - t0))
+
+    if args.cmd == 'stats':
+        for store, s in sorted(idx.stats().items(), key=lambda kv: kv[1]['bytes']):
+            oldest = s['oldest'] and datetime.datetime.fromtimestamp(s['oldest']).strftime('%Y-%m-%d')
+            print('%-14s %8d files %10s  oldest access %s' % (store, s['files'], fmt_size(s['bytes']), oldest))
+        print()
+        for d, n, size in idx.top_dirs():
+            print('%10s %8d  %s' % (fmt_size(size), n, d or '.'))
+
+    elif args.cmd == 'prune':
+        max_age = dict(default_max_age)
+        if args.max_age:
+            max_age['*'] = cache.to_timedelta(args.max_age)
+        budget = parse_size(args.budget) if args.budget else None
+        r = idx.prune(budget_bytes=budget, max_age=max_age, dry_run=args.dry_run)
+        print('%s %d files, %s' % ('would delete' if args.dry_run else 'deleted', r['files'], fmt_size(r['bytes'])))
+        print('remaining', fmt_size(idx.stats()['total']['bytes']))
+
+    idx.close()
+
+
+def _maintenance_started():
+    return start_background_maintenance() is not None
+
+
+def tests():
+    import tempfile
+    root = tempfile.mkdtemp()
+    _now = time.time()
+    for i, rel in enumerate(['a.pkl', 'm/x/f.pickle', 'm/x/g.pickle.lz4', 'm/y/h.arrows', 'p.parquet',
+                             'm/x/f.pickle.abc123.tmp']):
+        fn = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, 'wb') as f:
+            f.write(b'\0' * 1000)
+        t = _now - (10 - i) * 24 * 3600
+        os.utime(fn, (t, t))
+
+    idx = CacheIndex(root)
+    idx.scan()
+    st = idx.stats()
+    assert st['total']['files'] == 6 and st['total']['bytes'] == 6000, st
+    assert st['pickle']['files'] == 3 and st['influx']['files'] == 1 and st['tmp']['files'] == 1
+
+    # influx older than 7 days and the stale tmp file
+    assert idx.prune(dry_run=True)['files'] == 2
+    assert idx.prune()['files'] == 2
+    assert not os.path.exists(os.path.join(root, 'a.pkl'))
+
+    # LRU: oldest pickle goes first
+    assert idx.prune(budget_bytes=3000)['files'] == 1
+    assert not os.path.exists(os.path.join(root, 'm/x/f.pickle'))
+
+    # a file accessed after indexing is kept
+    os.utime(os.path.join(root, 'm/x/g.pickle.lz4'))
+    idx.prune(budget_bytes=2000)
+    assert os.path.exists(os.path.join(root, 'm/x/g.pickle.lz4'))
+    assert not os.path.exists(os.path.join(root, 'm/y/h.arrows'))
+
+    os.unlink(os.path.join(root, 'p.parquet'))
+    idx.scan()
+    assert idx.stats()['total']['files'] == 1
+    idx.close()
+
+    assert parse_size('20G') == 20 << 30 and parse_size('1.5k') == 1536 and parse_size(100) == 100
+
+    # no maintenance thread in worker processes
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        assert pool.apply(_maintenance_started) is False
+
+
+if __name__ == '__main__':
+    main()
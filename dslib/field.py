@@ -1,12 +1,32 @@
 import math
+import sys
 
 from dslib.pdf2txt import normalize_dash
 
 
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+def _plain(v):
+    if hasattr(v, 'item'):  # numpy scalar
+        v = v.item()
+    return _intern(v)
+
+
+def _compact_cond(cond):
+    # tabula rows come with numpy scalars and many repeating strings, store a flat tuple of plain python values.
+    # the dict is only built when `cond` is accessed
+    if not cond:
+        return None
+    return tuple((_plain(k), _plain(v)) for k, v in cond.items())
+
+
 class Field():
+    __slots__ = ('symbol', 'min', 'typ', 'max', 'unit', '_cond')
 
     def __init__(self, symbol: str, min, typ, max, mul=1, cond=None, unit=None):
-        self.symbol = symbol
+        self.symbol = _intern(symbol)
 
         if unit in {'uC', 'μC'}:
             assert mul == 1
@@ -23,9 +43,9 @@ class Field():
             mul = 1e6
             unit = 'pF'
 
-        min = parse_field_value(min) * mul
-        typ = parse_field_value(typ) * mul
-        max = parse_field_value(max) * mul
+        min = float(parse_field_value(min) * mul)
+        typ = float(parse_field_value(typ) * mul)
+        max = float(parse_field_value(max) * mul)
 
         if symbol == 'Qrr' and math.isnan(max) and not math.isnan(min) and not math.isnan(typ):
             max = typ
@@ -36,13 +56,29 @@ class Field():
         self.typ = typ
         self.max = max
 
-        self.unit = unit
+        self.unit = _intern(unit)
 
-        self.cond = cond
+        self._cond = _compact_cond(cond)
 
         assert not math.isnan(self.typ) or not math.isnan(self.min) or not math.isnan(
             self.max), 'all nan ' + self.__repr__()
 
+    @property
+    def cond(self):
+        return self._cond and dict(self._cond)
+
+    def __getstate__(self):
+        return self.symbol, self.min, self.typ, self.max, self.unit, self._cond
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # pickled before __slots__
+            state = (state['symbol'], state['min'], state['typ'], state['max'], state.get('unit'),
+                     _compact_cond(state.get('cond')))
+        symbol, self.min, self.typ, self.max, unit, self._cond = state
+        self.symbol = _intern(symbol)
+        self.unit = _intern(unit)
+
     def __repr__(self):
         return f'Field("{self.symbol}", min={self.min}, typ={self.typ}, max={self.max}, unit="{self.unit}", cond={repr(self.cond)})'
 
@@ -5,10 +5,13 @@ import os
 from pyquery import PyQuery
 
 from dslib import mfr_tag
-from dslib.fetch import fetch_datasheet
 
 
-def read_lcsc_search_results(html_glob_path):
+def parse_lcsc_search_results(html_glob_path):
+    """
+    Yield (mfr, mpn, lcsc_num, ds_url) for each result row of the saved LCSC search result pages. mfr is the brand
+    name as listed, not yet a `mfr_tag`.
+    """
 
     files = sorted(glob.glob(html_glob_path))
 
@@ -28,21 +31,30 @@ def read_lcsc_search_results(html_glob_path):
             mnf_links = list(pq(a) for a in
                          trq.find('a.hoverUnderline[target="_blank"][href^="https://www.lcsc.com/brand-detail"]'))
             assert len(mnf_links) == 1
-            mfr =  mfr_tag(mnf_links[0].text())
+            mfr = mnf_links[0].text()
             ds_url =  trq.find('a.datasheet').attr('href')
 
             if ds_url == 'https://www.lcsc.com/':
                 ds_url = None
 
-            print(mfr, mpn, lcsc_num, ds_url)
-
             if ds_url:
                 ds_url = ds_url.replace('https://www.lcsc.com/datasheet/lcsc_datasheet_',
                                         'https://wmsc.lcsc.com/wmsc/upload/file/pdf/v2/lcsc/')
 
-                datasheet_path = os.path.join('../datasheets', mfr, mpn + '.pdf')
-                fetch_datasheet(ds_url, datasheet_path, mfr=mfr, mpn=mpn)
+            yield mfr, mpn, lcsc_num, ds_url
+
+
+def read_lcsc_search_results(html_glob_path):
+    from dslib.fetch import fetch_datasheet
+
+    for mfr, mpn, lcsc_num, ds_url in parse_lcsc_search_results(html_glob_path):
+        mfr = mfr_tag(mfr)
+        print(mfr, mpn, lcsc_num, ds_url)
+
+        if ds_url:
+            datasheet_path = os.path.join('../datasheets', mfr, mpn + '.pdf')
+            fetch_datasheet(ds_url, datasheet_path, mfr=mfr, mpn=mpn)
 
 
 if __name__ == '__main__':
-    read_lcsc_search_results('../search-results/lcsc/80v 26a 10mohm p*.html')
\ No newline at end of file
+    read_lcsc_search_results('../search-results/lcsc/80v 26a 10mohm p*.html')
@@ -0,0 +1,111 @@
+"""
+Supplier part lists (search result exports) normalized into one columnar parts table.
+
+Each source adapter reads the raw export of a supplier and maps its columns onto `PART_COLUMNS`.
+Numeric columns are parsed per column with `dslib.units.parse_si`, so the cost of unit parsing does not grow
+with the number of sources and rows are never parsed one by one in python.
+
+    parts = read_part_list('digikey-results/*.csv', source='digikey')
+
+Normalized columns (SI units):
+
+    source      name of the source adapter
+    mfr         manufacturer tag, see `dslib.mfr_tag`
+    mpn         manufacturer part number
+    datasheet   datasheet url
+    package     package / case
+    Vds         drain-source voltage [V]
+    Id          continuous drain current [A] (first value, usually @ Tc=25°C)
+    Rds_on      max on-resistance [Ohm]
+    Qg          max total gate charge [C]
+    Vth         max gate threshold voltage [V]
+"""
+import glob
+from typing import Callable, Dict
+
+import pandas as pd
+
+from dslib import mfr_tag
+from dslib.units import parse_si
+
+PART_COLUMNS = ['source', 'mfr', 'mpn', 'datasheet', 'package', 'Vds', 'Id', 'Rds_on', 'Qg', 'Vth']
+
+part_sources: Dict[str, Callable[[str], pd.DataFrame]] = {}
+
+
+def part_source(name):
+    """
+    Decorator registering a source adapter. The adapter reads a single file and returns a DataFrame with
+    (a subset of) `PART_COLUMNS`.
+    """
+
+    def decorate(reader):
+        assert name not in part_sources, name
+        part_sources[name] = reader
+        return reader
+
+    return decorate
+
+
+def _si_column(col, unit):
+    return parse_si(col, unit, conditions=False)[0]
+
+
+def normalize_part_table(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    df = df.reindex(columns=PART_COLUMNS)
+    df['source'] = source
+    for col in ['Vds', 'Id', 'Rds_on', 'Qg', 'Vth']:
+        df[col] = df[col].astype(float)
+    df['mpn'] = df.mpn.astype(str)
+    # the number of distinct manufacturers is small, map each only once
+    df['mfr'] = df.mfr.map({m: mfr_tag(m) for m in df.mfr.dropna().unique()})
+    return df
+
+
+@part_source('digikey')
+def read_digikey_csv(fn) -> pd.DataFrame:
+    raw = pd.read_csv(fn)
+    return pd.DataFrame(dict(
+        mfr=raw['Mfr'],
+        mpn=raw['Mfr Part #'],
+        datasheet=raw['Datasheet'],
+        package=raw['Package / Case'],
+        Vds=_si_column(raw['Drain to Source Voltage (Vdss)'], 'V'),
+        Id=_si_column(raw['Current - Continuous Drain (Id) @ 25°C'], 'A'),
+        Rds_on=_si_column(raw['Rds On (Max) @ Id, Vgs'], 'Ohm'),
+        Qg=_si_column(raw['Gate Charge (Qg) (Max) @ Vgs'], 'C'),
+        Vth=_si_column(raw['Vgs(th) (Max) @ Id'], 'V'),
+    ))
+
+
+@part_source('mouser')
+def read_mouser_csv(fn) -> pd.DataFrame:
+    raw = pd.read_csv(fn)
+    return pd.DataFrame(dict(
+        mfr=raw['Manufacturer'],
+        mpn=raw['Mfr. #'],
+        datasheet=raw.get('Datasheet'),
+        package=raw.get('Package / Case'),
+        Vds=_si_column(raw['Vds - Drain-Source Breakdown Voltage'], 'V'),
+        Id=_si_column(raw['Id - Continuous Drain Current'], 'A'),
+        Rds_on=_si_column(raw['Rds On - Drain-Source Resistance'], 'Ohm'),
+        Qg=_si_column(raw['Qg - Gate Charge'], 'C'),
+        Vth=_si_column(raw['Vgs th - Gate-Source Threshold Voltage'], 'V'),
+    ))
+
+
+@part_source('lcsc')
+def read_lcsc_html(fn) -> pd.DataFrame:
+    from dslib.lcsc import parse_lcsc_search_results
+    return pd.DataFrame(parse_lcsc_search_results(fn), columns=['mfr', 'mpn', 'lcsc_num', 'datasheet'])
+
+
+def read_part_list(glob_path, source) -> pd.DataFrame:
+    """
+    Read all supplier exports matching `glob_path` into one normalized parts table.
+    """
+    reader = part_sources[source]
+    dfs = [reader(fn) for fn in sorted(glob.glob(glob_path))]
+    if not dfs:
+        return normalize_part_table(pd.DataFrame(columns=PART_COLUMNS), source)
+    return normalize_part_table(pd.concat(dfs, axis=0, ignore_index=True), source)
@@ -1,13 +1,37 @@
-def normalize_dash(s):
-    s = s.replace('‐', '-')  # utf8 b'\xe2\x80\x90'
-    s = s.replace('‑', '-')  # utf8 b'\xe2\x80\x91'
-    s = s.replace('−', '-')  # utf8 b'\xe2\x80\x92'
-    s = s.replace('–', '-')  # utf8 b'\xe2\x80\x93'
-    s = s.replace('—', '-')
+# characters normalize_dash replaces (see `char_table`)
+dash_map = {
+    '\u2010': '-',  # utf8 b'\xe2\x80\x90'
+    '\u2011': '-',  # utf8 b'\xe2\x80\x91'
+    '\u2212': '-',  # utf8 b'\xe2\x80\x92'
+    '\u2013': '-',  # utf8 b'\xe2\x80\x93'
+    '\u2014': '-',
+    '\ue025': '-',  # toshiba
+    '\u0192': 'f',  # datasheets/ti/CSD19531Q5A.pdf
+    '\u201c': '"',
+    '\u201d': '"',
+}
+
 
-    s = s.replace('', '-') # toshiba
+def char_table(char_map: dict) -> tuple:
+    return tuple(char_map.items())
 
-    s = s.replace('ƒ', 'f')# datasheets/ti/CSD19531Q5A.pdf
-    s = s.replace('“', '"')
-    s = s.replace('”', '"')
+
+def replace_chars(s, table: tuple):
+    """
+    Replace single characters by `table` (see `char_table`). Scans only for characters that are present: all mapped
+    characters are non-ascii and `isascii()` is O(1), and `c in s` runs at memchr speed. str.translate() is slower
+    on long, mostly-ascii texts, it maps char by char.
+    """
+    if s.isascii():
+        return s
+    for c, r in table:
+        if c in s:
+            s = s.replace(c, r)
     return s
+
+
+_dash_table = char_table(dash_map)
+
+
+def normalize_dash(s):
+    return replace_chars(s, _dash_table)
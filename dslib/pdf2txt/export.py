@@ -0,0 +1,109 @@
+"""
+Export the extracted tables of all datasheets into one compressed Parquet file, for debugging the table parsers
+(replaces the `<pdf>.csv` files `tabula_read` used to write next to each datasheet):
+
+    python -m dslib.pdf2txt.export datasheets tables.parquet
+    python -m dslib.pdf2txt.export datasheets words.parquet --backend words --mfr infineon
+
+One row per table row with columns mfr, mpn, table, row, c0, c1, ... (dash-normalized strings). Tables are read
+through the stage caches, `--workers N` extracts uncached ones in parallel.
+
+    pd.read_parquet('tables.parquet').query('mpn == "BSC025N08LS5ATMA1"')
+"""
+import argparse
+import sys
+
+from dslib.cache import dependency_stat_cache
+from dslib.pdf2txt import normalize_dash
+
+
+def table_stage(backend='tabula'):
+    """
+    :return: the cached stage function of the backend
+    """
+    from dslib.pdf2txt.parse import pymupdf_tables, tabula_pdf_dataframes
+    return tabula_pdf_dataframes if backend == 'tabula' else pymupdf_tables
+
+
+def datasheet_tables(pdf_path, backend='tabula') -> list:
+    return table_stage(backend)(pdf_path)
+
+
+def _iter_tables(items, backend, workers):
+    if workers and workers > 1:
+        # tables come back from the workers as Arrow in shared memory
+        from dslib.pdf2txt.supervisor import SupervisedExecutor
+        names = {pdf_path: (mfr, mpn) for pdf_path, mfr, mpn in items}
+        with SupervisedExecutor(workers=workers) as ex:
+            # killed tasks are recorded under the stage, later exports skip them
+            for (pdf_path, _), dfs, err in ex.map(datasheet_tables, [(it[0], backend) for it in items],
+                                                  failure_fn=table_stage(backend)):
+                yield (pdf_path, *names[pdf_path]), dfs, err
+        return
+    # each datasheet is stat'ed once for the whole export
+    with dependency_stat_cache():
+        for it in items:
+            try:
+                yield it, datasheet_tables(it[0], backend), None
+            except Exception as e:
+                yield it, None, e
+
+
+def tables_frame(items, backend='tabula', workers=None):
+    """
+    :param items: [(pdf_path, mfr, mpn)]
+    :param workers: extract in this many processes (for a cold cache)
+    :return: DataFrame of all table rows, failed datasheets are left out
+    """
+    import pandas as pd
+
+    frames = []
+    failed = 0
+    for (pdf_path, mfr, mpn), dfs, err in _iter_tables(items, backend, workers):
+        if err is not None:
+            print(pdf_path, err, file=sys.stderr)
+            failed += 1
+            continue
+        for i, df in enumerate(dfs):
+            df = df.set_axis(['c%d' % c for c in range(df.shape[1])], axis=1)
+            df.insert(0, 'row', range(len(df)))
+            df.insert(0, 'table', i)
+            df.insert(0, 'mpn', mpn)
+            df.insert(0, 'mfr', mfr)
+            frames.append(df)
+
+    if failed:
+        print('%d datasheets without tables' % failed, file=sys.stderr)
+    if not frames:
+        return pd.DataFrame(columns=['mfr', 'mpn', 'table', 'row'])
+
+    df = pd.concat(frames, ignore_index=True)
+    for c in df.columns[4:]:
+        col = df[c]
+        df[c] = col.where(col.isna(), col.astype(str)).map(normalize_dash, na_action='ignore').astype('string')
+    return df
+
+
+def export_tables(datasheet_dir, out_path, backend='tabula', mfrs=None, workers=None, compression='zstd'):
+    from dslib.pdf2txt.warmup import find_datasheets
+    items = find_datasheets(datasheet_dir, mfrs)
+    df = tables_frame(items, backend, workers=workers)
+    df.to_parquet(out_path, index=False, compression=compression)
+    print('wrote %d rows of %d datasheets to %s' % (len(df), df.mpn.nunique(), out_path), file=sys.stderr)
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dslib.pdf2txt.export', description=__doc__.split('\n\n')[0])
+    parser.add_argument('datasheet_dir', nargs='?', default='datasheets')
+    parser.add_argument('out_path', nargs='?', default='tables.parquet')
+    parser.add_argument('--backend', choices=['tabula', 'words'], default='tabula')
+    parser.add_argument('--mfr', action='append', help='only these manufacturers (repeatable)')
+    parser.add_argument('--workers', type=int, default=None, help='extract in parallel processes')
+    args = parser.parse_args(argv)
+    export_tables(args.datasheet_dir, args.out_path, backend=args.backend, mfrs=set(args.mfr) if args.mfr else None,
+                  workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
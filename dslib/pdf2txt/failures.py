@@ -0,0 +1,239 @@
+"""
+Persistent registry of datasheet extraction failures, keyed by PDF content hash, stage (e.g. 'tabula') and stage
+version (code fingerprint). Exceptions are not cached by `disk_cache`, without the registry a PDF that crashes
+tabula would crash it again on every run.
+
+A failing (digest, stage, version) is retried with exponential back-off, after `max_attempts` it is skipped until
+the stage code changes (new version) or the entry is cleared:
+
+    python -m dslib.pdf2txt.failures report
+    python -m dslib.pdf2txt.failures clear --stage tabula
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from typing import Optional
+
+from dslib import cache
+
+
+class KnownFailure(Exception):
+    """
+    Raised instead of running a stage that is known to fail for the PDF.
+    """
+    pass
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, backoff=datetime.timedelta(days=1)):
+        """
+        :param max_attempts: skip for good after this many failures
+        :param backoff: wait after the first failure, doubles with each further failure
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def retry_at(self, count, last) -> Optional[float]:
+        """
+        :return: unix time of the next attempt, None if there is none
+        """
+        if count >= self.max_attempts:
+            return None
+        return last + self.backoff.total_seconds() * 2 ** (count - 1)
+
+
+class FailureRegistry:
+    def __init__(self, db_path=None, policy: RetryPolicy = None):
+        self.db_path = db_path or os.path.join(cache.cache_dir, '.failures.sqlite')
+        self.policy = policy or RetryPolicy()
+        self._lock = threading.Lock()
+        self._con: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            cache.mkdir_p(os.path.dirname(self.db_path))
+            con = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS failures (digest TEXT, stage TEXT, version TEXT, path TEXT, '
+                        'error TEXT, count INTEGER, first REAL, last REAL, PRIMARY KEY (digest, stage, version))')
+            self._con = con
+        return self._con
+
+    def should_skip(self, digest, stage, version) -> Optional[dict]:
+        """
+        :return: the failure record if the stage should not run for the PDF (now)
+        """
+        with self._lock:
+            row = self._db().execute('SELECT path, error, count, first, last FROM failures '
+                                     'WHERE digest = ? AND stage = ? AND version = ?',
+                                     (digest, stage, version)).fetchone()
+        if row is None:
+            return None
+        path, error, count, first, last = row
+        retry_at = self.policy.retry_at(count, last)
+        if retry_at is not None and time.time() >= retry_at:
+            return None
+        return dict(path=path, error=error, count=count, first=first, last=last, retry_at=retry_at)
+
+    def record(self, digest, stage, version, path, error, permanent=False):
+        """
+        :param error: exception or message
+        :param permanent: skip right away, without retries
+        """
+        if isinstance(error, BaseException):
+            error = '%s: %s' % (type(error).__name__, error)
+        _now = time.time()
+        with self._lock:
+            con = self._db()
+            with con:
+                con.execute('INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                            'ON CONFLICT (digest, stage, version) DO UPDATE SET '
+                            'path = excluded.path, error = excluded.error, count = MAX(count + 1, excluded.count), '
+                            'last = excluded.last',
+                            (digest, stage, version, path, str(error)[:2000],
+                             self.policy.max_attempts if permanent else 1, _now, _now))
+
+    def clear(self, stage=None, digest=None) -> int:
+        q, params = 'DELETE FROM failures WHERE 1', []
+        if stage:
+            q += ' AND stage = ?'
+            params.append(stage)
+        if digest:
+            q += ' AND digest = ?'
+            params.append(digest)
+        with self._lock:
+            con = self._db()
+            with con:
+                return con.execute(q, params).rowcount
+
+    def report(self) -> list:
+        """
+        :return: failure records (dicts), most frequent first
+        """
+        with self._lock:
+            rows = self._db().execute('SELECT digest, stage, version, path, error, count, first, last FROM failures '
+                                      'ORDER BY count DESC, last DESC').fetchall()
+        recs = []
+        for digest, stage, version, path, error, count, first, last in rows:
+            recs.append(dict(digest=digest, stage=stage, version=version, path=path, error=error, count=count,
+                             first=first, last=last, retry_at=self.policy.retry_at(count, last)))
+        return recs
+
+    def close(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+
+_registry: Optional[FailureRegistry] = None
+
+
+def failure_registry() -> FailureRegistry:
+    global _registry
+    if _registry is None:
+        _registry = FailureRegistry()
+    return _registry
+
+
+def failure_guarded(stage, version, known_failures=()):
+    """
+    Decorator for a stage function taking the pdf path as first argument. Raises `KnownFailure` without running the
+    stage if the registry says so, records exceptions of the stage.
+    Put it below `disk_cache`, so cache hits don't look up the registry.
+    :param version: stage version or a callable returning it (evaluated once), usually a `cache.code_fingerprint`
+    :param known_failures: '<mfr>/<mpn>.pdf' names recorded as permanent failures on first sight
+    """
+    _version = []
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(pdf_path=None, *args, **kwargs):
+            if pdf_path is None:
+                return fn(pdf_path, *args, **kwargs)
+            version_ = failure_version()
+            reg = failure_registry()
+            digest = cache.file_digest(pdf_path)
+            if known_failures and '/'.join(pdf_path.replace(os.sep, '/').split('/')[-2:]) in known_failures:
+                if not reg.should_skip(digest, stage, version_):
+                    reg.record(digest, stage, version_, pdf_path, 'listed as known failure', permanent=True)
+
+            rec = reg.should_skip(digest, stage, version_)
+            if rec:
+                raise KnownFailure('%s known to fail in %s (%dx, %s)' % (pdf_path, stage, rec['count'], rec['error']))
+            try:
+                return fn(pdf_path, *args, **kwargs)
+            except ImportError:
+                # missing dependency, not the PDF's fault
+                raise
+            except Exception as e:
+                reg.record(digest, stage, version_, pdf_path, e)
+                raise
+
+        def failure_version():
+            if not _version:
+                _version.append(version() if callable(version) else version)
+            return _version[0]
+
+        # for recording failures outside the process (`supervisor.py`), copied to outer decorators by `wraps`
+        wrapper.failure_stage = stage
+        wrapper.failure_version = failure_version
+        return wrapper
+
+    return decorate
+
+
+def _fmt_time(t):
+    return datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M') if t else 'never'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dslib.pdf2txt.failures')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('report', help='list recorded failures')
+    p = sub.add_parser('clear', help='forget failures, so they are retried')
+    p.add_argument('--stage')
+    p.add_argument('--digest')
+    args = parser.parse_args(argv)
+
+    reg = failure_registry()
+    if args.cmd == 'report':
+        recs = reg.report()
+        by_stage = {}
+        for r in recs:
+            by_stage[r['stage']] = by_stage.get(r['stage'], 0) + 1
+        print('%d failures %s' % (len(recs), by_stage))
+        for r in recs:
+            print('%-8s %2dx  retry %-16s %s  %s' % (r['stage'], r['count'], _fmt_time(r['retry_at']), r['path'],
+                                                    r['error'][:120]))
+    elif args.cmd == 'clear':
+        print('cleared %d' % reg.clear(stage=args.stage, digest=args.digest))
+
+
+def tests():
+    import tempfile
+    d = tempfile.mkdtemp()
+    reg = FailureRegistry(os.path.join(d, 'f.sqlite'), policy=RetryPolicy(max_attempts=2, backoff=datetime.timedelta(0)))
+    assert reg.should_skip('h', 'tabula', 'v1') is None
+    reg.record('h', 'tabula', 'v1', 'a.pdf', ValueError('x'))
+    assert reg.should_skip('h', 'tabula', 'v1') is None  # back-off 0, retry
+    reg.record('h', 'tabula', 'v1', 'a.pdf', ValueError('x'))
+    rec = reg.should_skip('h', 'tabula', 'v1')
+    assert rec and rec['count'] == 2 and rec['retry_at'] is None
+    assert reg.should_skip('h', 'tabula', 'v2') is None  # new stage version
+    reg.record('g', 'text', 'v1', 'b.pdf', 'timeout', permanent=True)
+    assert reg.should_skip('g', 'text', 'v1')
+    assert len(reg.report()) == 2
+    assert reg.clear(stage='tabula') == 1 and len(reg.report()) == 1
+    reg.close()
+
+    policy = RetryPolicy(max_attempts=3, backoff=datetime.timedelta(hours=1))
+    assert policy.retry_at(1, 0) == 3600 and policy.retry_at(2, 0) == 7200 and policy.retry_at(3, 0) is None
+
+
+if __name__ == '__main__':
+    main()
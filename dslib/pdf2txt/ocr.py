@@ -0,0 +1,205 @@
+"""
+OCR of scanned datasheet pages, with local Tesseract through PyMuPDF (`page.get_textpage_ocr`).
+
+Only pages without a text layer are OCRed, in parallel processes, cached per page content hash (not per PDF), so
+re-downloads and other stage versions don't OCR again. The text feeds `parse_datasheet` and the word boxes the
+`words_tables` backend of `tabula_read`.
+
+Opt-in, as it is slow on the first run and needs Tesseract (`apt install tesseract-ocr`, `brew install tesseract`):
+
+    DSLIB_OCR=1 python main.py
+
+The OCR text of a single datasheet:
+
+    python -m dslib.pdf2txt.ocr datasheets/diotec/DIT095N08.pdf
+"""
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from dslib.cache import disk_cache
+
+_enabled: Optional[bool] = None
+
+
+def enabled() -> bool:
+    """
+    OCR is enabled with env DSLIB_OCR=1 and Tesseract installed.
+    """
+    global _enabled
+    if _enabled is None:
+        _enabled = os.environ.get('DSLIB_OCR', '0') not in {'', '0', 'false', 'no'}
+        if _enabled:
+            import fitz  # PyMuPDF
+            try:
+                fitz.get_tessdata()
+            except RuntimeError as e:
+                print('DSLIB_OCR set but OCR not available:', e)
+                _enabled = False
+    return _enabled
+
+
+def page_needs_ocr(page) -> bool:
+    """
+    Page without text layer but with images (a scan).
+    """
+    return not page.get_text().strip() and bool(page.get_images())
+
+
+def page_digest(page) -> str:
+    """
+    Hash of the page content stream and its images.
+    """
+    doc = page.parent
+    h = hashlib.blake2b(page.read_contents(), digest_size=20)
+    for img in page.get_images():
+        h.update(doc.xref_stream_raw(img[0]) or b'')
+    return h.hexdigest()
+
+
+@disk_cache(ttl='999d', ignore_kwargs={'pdf_path', 'page_no'}, serializer='lz4')
+def ocr_page(digest, pdf_path=None, page_no=None, language='eng', dpi=300) -> dict:
+    """
+    :param digest: `page_digest` of the page, the cache key
+    :return: dict(text=str, words=[(x0, y0, x1, y1, word, block, line, word_no)])
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_no]
+        tp = page.get_textpage_ocr(language=language, dpi=dpi, full=True)
+        return dict(text=page.get_text(textpage=tp), words=page.get_text('words', textpage=tp))
+
+
+def _ocr_page(args):
+    digest, pdf_path, page_no = args
+    return page_no, ocr_page(digest, pdf_path=pdf_path, page_no=page_no)
+
+
+def ocr_document(pdf_path, workers=None) -> Dict[int, dict]:
+    """
+    OCR the pages without text layer.
+    :param workers: processes, defaults to cpu count (1 inside daemon workers, e.g. `supervisor.py`, these are
+        already parallel across PDFs)
+    :return: {page_no: `ocr_page` result}
+    """
+    import multiprocessing
+
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        todo = [(page_digest(page), pdf_path, i) for i, page in enumerate(doc) if page_needs_ocr(page)]
+    if not todo:
+        return {}
+
+    if workers is None:
+        workers = 1 if multiprocessing.current_process().daemon else os.cpu_count()
+    workers = min(workers, len(todo))
+    if workers <= 1:
+        return dict(map(_ocr_page, todo))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_ocr_page, todo))
+
+
+def fill_pages(pdf_path, pages: List[str]) -> List[str]:
+    """
+    :param pages: page texts of `extract_pages`
+    :return: pages with the empty ones replaced by OCR text
+    """
+    if all(p.strip() for p in pages):
+        return pages
+    res = ocr_document(pdf_path)
+    return [res[i]['text'] if i in res and not p.strip() else p for i, p in enumerate(pages)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dslib.pdf2txt.ocr', description=__doc__.split('\n\n')[0])
+    parser.add_argument('pdf_path')
+    parser.add_argument('--workers', type=int, default=None, help='OCR processes, defaults to cpu count')
+    args = parser.parse_args(argv)
+
+    import fitz  # PyMuPDF
+    try:
+        fitz.get_tessdata()
+    except RuntimeError as e:
+        parser.error('OCR not available: %s' % e)
+
+    res = ocr_document(args.pdf_path, workers=args.workers)
+    if not res:
+        print('all pages have a text layer', file=sys.stderr)
+    for page_no, r in sorted(res.items()):
+        print('--- page %d' % (page_no + 1))
+        print(r['text'])
+
+
+def tests():
+    import inspect
+    import shutil
+    import tempfile
+
+    import fitz  # PyMuPDF
+
+    from dslib import cache
+    from dslib.pdf2txt import failures, parse
+
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 50), 'Qrr 55 nC')
+    doc.new_page()
+    page, blank = doc[0], doc[1]
+    assert not page_needs_ocr(page)
+    assert not page_needs_ocr(blank)  # no images, nothing to OCR
+    assert page_digest(page) != page_digest(blank)
+
+    # text page, scanned page (an image only), text page
+    d = tempfile.mkdtemp()
+    pdf_path = os.path.join(d, 'scan.pdf')
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 50), 'Infineon OptiMOS')
+    scan = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20))
+    scan.clear_with(255)
+    doc.new_page().insert_image(fitz.Rect(50, 50, 250, 250), stream=scan.tobytes('png'))
+    doc.new_page().insert_text((50, 50), 'Package outline')
+    doc.save(pdf_path)
+    doc.close()
+
+    # stub tesseract, and tabula of parse_datasheet
+    g = globals()
+    saved = {k: g[k] for k in ('ocr_page', 'ocr_document', '_enabled')}
+    saved_table_fields, cache_dir, registry = parse.table_fields, cache.cache_dir, failures._registry
+    try:
+        g['ocr_page'] = lambda digest, pdf_path=None, page_no=None, **kw: dict(
+            text='Qrr Reverse Recovery Charge 1 55 60 nC\n', words=[])
+        res = ocr_document(pdf_path, workers=1)
+        assert list(res) == [1], res
+
+        pages = fill_pages(pdf_path, ['Infineon OptiMOS\n', '', 'Package outline\n'])
+        assert pages[0] == 'Infineon OptiMOS\n' and pages[2] == 'Package outline\n'
+        assert pages[1].startswith('Qrr'), pages
+        assert fill_pages(pdf_path, ['a', 'b']) == ['a', 'b']
+
+        # OCR results for pages with text are not merged
+        g['ocr_document'] = lambda pdf_path, workers=None: {0: dict(text='OCR'), 1: dict(text='OCR')}
+        assert fill_pages(pdf_path, ['text', ' ']) == ['text', 'OCR']
+        g['ocr_document'] = saved['ocr_document']
+
+        # the merge in parse_datasheet, unwrapped: the cache and failure wrappers keep the stage version they see
+        # first, which must not be one with OCR enabled
+        g['_enabled'] = True
+        parse.table_fields = lambda pdf_path: {}
+        cache.cache_dir = os.path.join(d, 'cache')
+        failures._registry = None
+        fields = inspect.unwrap(parse.parse_datasheet)(pdf_path, mfr='infineon', mpn='scan')
+        assert fields.Qrr.typ == 55, fields
+    finally:
+        g.update(saved)
+        parse.table_fields = saved_table_fields
+        cache.cache_dir = cache_dir
+        if failures._registry not in (None, registry):
+            failures._registry.close()
+        failures._registry = registry
+        shutil.rmtree(d, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,126 @@
 import math
 import os.path
 import re
+import sys
 from typing import List
 
-import pandas as pd
-
 from dslib import dotdict, mfr_tag
-from dslib.cache import disk_cache
+from dslib.cache import code_fingerprint, disk_cache
 from dslib.field import Field
-from dslib.pdf2txt import expr, normalize_dash
+from dslib.pdf2txt import char_table, dash_map, expr, normalize_dash, replace_chars
+from dslib.pdf2txt.failures import failure_guarded
 
 
-@disk_cache(ttl='30d', file_dependencies=True)
-def extract_text(pdf_path):
+def _text_stage_version():
+    # the text comes from iter_pages, extract_pages only caches it
+    return code_fingerprint(extract_pages, iter_pages)
+
+
+def _tabula_stage_version():
+    return code_fingerprint(tabula_pdf_dataframes)
+
+
+def _words_stage_version():
+    import dslib.pdf2txt.words_tables
+    from dslib.pdf2txt import ocr
+    return code_fingerprint(pymupdf_tables, dslib.pdf2txt.words_tables, ocr if ocr.enabled() else '')
+
+
+def _parse_stage_version():
+    """
+    Parsing depends on all of this module (regexes, tabula row iteration), the expressions in `expr`, dash
+    normalization, Field and the word box tables. Editing any of it re-parses, but reuses the cached text and tabula
+    tables.
+    """
+    import dslib.field
+    import dslib.pdf2txt
+    import dslib.pdf2txt.words_tables
+    from dslib.pdf2txt import ocr
+    return code_fingerprint('v02', sys.modules[__name__], expr, dslib.pdf2txt, dslib.field,
+                            dslib.pdf2txt.words_tables, ocr if ocr.enabled() else '')
+
+
+@disk_cache(ttl='30d', file_dependencies=True, serializer='lz4', salt=_text_stage_version)
+@failure_guarded('text', _text_stage_version)
+def extract_pages(pdf_path) -> List[str]:
+    """
+    Text of each page of the PDF (not normalized).
+    """
+    return list(iter_pages(pdf_path))
+
+
+def iter_pages(pdf_path):
+    """
+    Yields the text of each page, uncached.
+    """
     import fitz  # PyMuPDF
-    pdf_document = fitz.open(pdf_path)
+    with fitz.open(pdf_path) as pdf_document:
+        for page in pdf_document:
+            yield page.get_text()
+
+
+def extract_text(pdf_path):
+    return ''.join(extract_pages(pdf_path))
+
+
+# character normalization of pdf text. the toshiba glyph and \x04 become \x03 (Field strips it) rather than a dash
+_pdf_text_table = char_table({**dash_map, '\ue025': '\x03', '\x04': '\x03'})
+
+
+def normalize_pdf_text(s):
+    if '\0' in s:
+        s = s.replace('\0x04', '\x03').replace('\0x03', '\x03')
+    if '\x04' in s:
+        # ascii, not covered by the non-ascii fast path of replace_chars
+        s = s.replace('\x04', '\x03')
+    return replace_chars(s, _pdf_text_table)
 
-    pdf_text = ""
-    for page_number in range(len(pdf_document)):
-        page = pdf_document[page_number]
-        pdf_text += page.get_text()
 
-    pdf_document.close()
-    return pdf_text
+# any of the Qrr patterns in `expr.QRR` contains one of these
+_qrr_page_hint = re.compile(r'q\s?rr|recover', re.IGNORECASE)
 
 
-@disk_cache(ttl='30d', file_dependencies=[0], salt='v02')
+def qrr_candidate_text(pages: List[str]) -> List[str]:
+    """
+    Chunks of consecutive pages that might hold the Qrr value, each page mentioning it together with the previous
+    page (condition prefixes like 'IF=..' can end it) and the next page (tables can continue on the next page).
+    """
+    chunks, start, end = [], None, None
+    for i, page in enumerate(pages):
+        if not _qrr_page_hint.search(page):
+            continue
+        if start is not None and i <= end + 2:
+            end = i + 1
+        else:
+            if start is not None:
+                chunks.append(''.join(pages[max(start - 1, 0):end + 1]))
+            start, end = i, i + 1
+    if start is not None:
+        chunks.append(''.join(pages[max(start - 1, 0):end + 1]))
+    return chunks
+
+
+@disk_cache(ttl='30d', file_dependencies=[0], salt=_parse_stage_version, serializer='lz4')
+@failure_guarded('parse', _parse_stage_version)
 def parse_datasheet(pdf_path=None, mfr=None, mpn=None):
     if not pdf_path:
         pdf_path = f'datasheets/{mfr}/{mpn}.pdf'
 
-    pdf_text = extract_text(pdf_path)
-    if not pdf_text:
+    pages = extract_pages(pdf_path)
+    from dslib.pdf2txt import ocr
+    if ocr.enabled():
+        pages = ocr.fill_pages(pdf_path, pages)
+    pages = [normalize_pdf_text(p) for p in pages]
+    if not any(pages):
         print(pdf_path, 'no text extracted')
 
-    pdf_text = pdf_text.replace('\0x04', '\x03')  # utf8 b'\xe2\x80\x93' toshiba
-    pdf_text = pdf_text.replace('', '\x03')  # toshiba
-    pdf_text = pdf_text.replace('\0x03', '\x03')
-    pdf_text = pdf_text.replace('', '\x03')
-    pdf_text = normalize_dash(pdf_text)
-
     fields: List[Field] = []
 
     pat = expr.QRR.get(mfr)
 
     if pat:
         rg = re.compile(pat, re.MULTILINE | re.IGNORECASE)
-        qrr_ms = list(rg.finditer(pdf_text))
+        qrr_ms = [m for chunk in qrr_candidate_text(pages) for m in rg.finditer(chunk)]
 
         # if len(qrr_ms) != 1:
         #    if len(qrr_ms) == 2 and mpn in {'IQD016N08NM5ATMA1', 'FDMC007N08LC', 'FDMS4D4N08C'}:
@@ -56,7 +130,7 @@ def parse_datasheet(pdf_path=None, mfr=None, mpn=None):
         #        print(pdf_path, 'no Qrr match', pdf_text[:200].replace('\n', '<br>'))
 
         if len(qrr_ms) == 0:
-            print(pdf_path, 'no Qrr match', pdf_text[:200].replace('\n', '<br>'))
+            print(pdf_path, 'no Qrr match', ''.join(pages)[:200].replace('\n', '<br>'))
 
         for qrr_m in qrr_ms:
             qrr_d = qrr_m.groupdict()
@@ -79,7 +153,7 @@ def parse_datasheet(pdf_path=None, mfr=None, mpn=None):
             print('no Qrr pattern for ', mfr)
 
     try:
-        tab_fields = tabula_read(pdf_path)
+        tab_fields = table_fields(pdf_path)
         fields.extend(tab_fields.values())
     except Exception as e:
         print(pdf_path, 'tabula error', e)
@@ -94,33 +168,36 @@ def parse_datasheet(pdf_path=None, mfr=None, mpn=None):
     return d
 
 
-@disk_cache(ttl='99d', file_dependencies=True)
+# seed of the failure registry, tabula crashes on these
+tabula_known_failures = {
+    'onsemi/NVMFS6H800NLT1G.pdf',
+    'onsemi/NVMFS6H800NT1G.pdf', 'onsemi/NTMFS6H800NLT1G.pdf',
+    'onsemi/FDD86367.pdf', 'onsemi/FDD86369.pdf', 'onsemi/NTMFS6H800NT1G.pdf',
+    'onsemi/NTMFWS1D5N08XT1G.pdf', 'onsemi/FDMC008N08C.pdf',
+    'onsemi/NVMFS6H800NWFT1G.pdf', 'onsemi/NVMFS6H800NLWFT1G.pdf',
+    'onsemi/NTMFS08N2D5C.pdf', 'nxp/PSMN4R3-80ES,127.pdf',
+    'nxp/PSMN3R5-80PS,127.pdf', 'nxp/PSMN4R3-80PS,127.pdf',
+    'onsemi/FDD86367-F085.pdf', 'onsemi/NVMFWS6D2N08XT1G.pdf',
+    'onsemi/FDD86369-F085.pdf', 'onsemi/NVMFWS1D9N08XT1G.pdf',
+    'ao/AOTL66811.pdf',
+    'littelfuse/IXTA160N10T7.pdf',
+    'goford/GT023N10Q.pdf',
+    'onsemi/FDB047N10.pdf',
+    'onsemi/FDP047N10.pdf',
+    'infineon/IPB033N10N5LFATMA1.pdf',
+
+    'diodes/DMT10H9M9SCT.pdf',  # unsupported operation
+    'diodes/DMT10H9M9LCT.pdf',
+    'good_ark/GSFT3R110.pdf',
+    'diodes/DMTH10H005SCT.pdf',
+}
+
+
+@disk_cache(ttl='99d', file_dependencies=True, serializer='arrow', salt=_tabula_stage_version)
+@failure_guarded('tabula', _tabula_stage_version, known_failures=tabula_known_failures)
 def tabula_pdf_dataframes(pdf_path=None):
     import tabula
 
-    fails = {'datasheets/onsemi/NVMFS6H800NLT1G.pdf',
-             'datasheets/onsemi/NVMFS6H800NT1G.pdf', 'datasheets/onsemi/NTMFS6H800NLT1G.pdf',
-             'datasheets/onsemi/FDD86367.pdf', 'datasheets/onsemi/FDD86369.pdf', 'datasheets/onsemi/NTMFS6H800NT1G.pdf',
-             'datasheets/onsemi/NTMFWS1D5N08XT1G.pdf', 'datasheets/onsemi/FDMC008N08C.pdf',
-             'datasheets/onsemi/NVMFS6H800NWFT1G.pdf', 'datasheets/onsemi/NVMFS6H800NLWFT1G.pdf',
-             'datasheets/onsemi/NTMFS08N2D5C.pdf', 'datasheets/nxp/PSMN4R3-80ES,127.pdf',
-             'datasheets/nxp/PSMN3R5-80PS,127.pdf', 'datasheets/nxp/PSMN4R3-80PS,127.pdf',
-             'datasheets/onsemi/FDD86367-F085.pdf', 'datasheets/onsemi/NVMFWS6D2N08XT1G.pdf',
-             'datasheets/onsemi/FDD86369-F085.pdf', 'datasheets/onsemi/NVMFWS1D9N08XT1G.pdf',
-             'datasheets/ao/AOTL66811.pdf',
-             'datasheets/littelfuse/IXTA160N10T7.pdf',
-             'datasheets/goford/GT023N10Q.pdf',
-             'datasheets/onsemi/FDB047N10.pdf',
-             'datasheets/onsemi/FDP047N10.pdf',
-             'datasheets/infineon/IPB033N10N5LFATMA1.pdf',
-
-             'datasheets/diodes/DMT10H9M9SCT.pdf',  # unsupported operation
-             'datasheets/diodes/DMT10H9M9LCT.pdf',
-             'datasheets/good_ark/GSFT3R110.pdf',
-             'datasheets/diodes/DMTH10H005SCT.pdf',
-             }
-    if pdf_path in fails:
-        raise Exception(f'PDF {pdf_path} known to fail')
     dfs = tabula.read_pdf(pdf_path, pages='all', pandas_options={'header': None})
 
     # pd.concat(dfs, ignore_index=True, axis=0).to_csv(pdf_path+'.csv', index=False)
@@ -162,7 +239,7 @@ valid_range = dict(
 def parse_row_value(csv_line, dim, field_sym, cond=None):
     range = valid_range.get(field_sym)
     err = []
-    for r in dim_regs[dim]:
+    for r in get_dim_regs()[dim]:
         m = next(r.finditer(csv_line), None)
         if m is None:
             continue
@@ -237,7 +314,7 @@ def field_value_regex_variations(head, unit):
                    re.IGNORECASE),
 
         re.compile(
-            head + r'[-\s]{,2}\s*,?\s*(?P<min>nan|-*|[0-9.]+)\s*,?\s*(?P<typ>nan|-*|[0-9.]+)\s*,?\s*(?P<max>nan|-*|[0-9.]+)\s*,?\s*(?P<unit>' + unit + r')(,|$)',
+            head + r'[-\s]{,2}\s*+,?\s*+(?P<min>nan|-*|[0-9.]+)\s*+,?\s*+(?P<typ>nan|-*|[0-9.]+)\s*+,?\s*+(?P<max>nan|-*|[0-9.]+)\s*+,?\s*+(?P<unit>' + unit + r')(,|$)',
             re.IGNORECASE),
 
         re.compile(
@@ -288,7 +365,7 @@ def get_dimensional_regular_expressions():
                          re.IGNORECASE),
 
               re.compile(
-                  r'(time|t[_\s]?[rf])\s*,?\s*(?P<min>nan|-*|[-0-9.]+)\s*,?\s*(?P<typ>nan|-*|[-0-9.]+)\s*,?\s*(?P<max>nan|-*|[-0-9.]+)\s*,?\s*(?P<unit>[uμn]s)(,|$)',
+                  r'(time|t[_\s]?[rf])\s*+,?\s*+(?P<min>nan|-*|[-0-9.]+)\s*+,?\s*+(?P<typ>nan|-*|[-0-9.]+)\s*+,?\s*+(?P<max>nan|-*|[-0-9.]+)\s*+,?\s*+(?P<unit>[uμn]s)(,|$)',
                   re.IGNORECASE),
 
           ] + field_value_regex_variations(r'(time|t[_\s]?[rf])', r'[uμn]s'),
@@ -311,7 +388,7 @@ def get_dimensional_regular_expressions():
                          re.IGNORECASE),
 
               re.compile(
-                  r'(charge|Q[\s_]?[a-z]{1,3})[-\s]{,2}\s*,?\s*(?P<min>nan|-*|[0-9.]+)\s*,?\s*(?P<typ>nan|-*|[0-9.]+)\s*,?\s*(?P<max>nan|-*|[0-9.]+)\s*,?\s*(?P<unit>[uμn]C)(,|$)',
+                  r'(charge|Q[\s_]?[a-z]{1,3})[-\s]{,2}\s*+,?\s*+(?P<min>nan|-*|[0-9.]+)\s*+,?\s*+(?P<typ>nan|-*|[0-9.]+)\s*+,?\s*+(?P<max>nan|-*|[0-9.]+)\s*+,?\s*+(?P<unit>[uμn]C)(,|$)',
                   re.IGNORECASE),
 
               re.compile(
@@ -364,16 +441,50 @@ def get_field_detect_regex(mfr):
     return fields_detect
 
 
+@disk_cache(ttl='99d', file_dependencies=True, serializer='arrow', salt=_words_stage_version)
+@failure_guarded('words', _words_stage_version)
+def pymupdf_tables(pdf_path):
+    from dslib.pdf2txt.words_tables import pdf_tables
+    return pdf_tables(pdf_path)
+
+
+def table_fields(ds_path):
+    """
+    Fields from the PDF tables. Tables are rebuilt from PyMuPDF word boxes first, tabula fills in the fields these
+    miss (it only runs if any detectable field is missing).
+    """
+    d = dotdict()
+    try:
+        d = read_table_fields(ds_path, pymupdf_tables(ds_path))
+    except Exception as e:
+        print(ds_path, 'pymupdf tables error', e)
+
+    missing = set(get_field_detect_regex(ds_path.split('/')[-2])) - set(d)
+    if missing:
+        tab = tabula_read(ds_path)
+        for sym in missing:
+            if sym in tab:
+                d[sym] = tab[sym]
+    return d
+
+
 def tabula_read(ds_path):
+    # no side effects, for table dumps see `python -m dslib.pdf2txt.export`
     try:
         dfs = tabula_pdf_dataframes(ds_path)
-        if not os.path.isfile(ds_path + '.csv'):
-            pd.concat(dfs, ignore_index=True, axis=0).applymap(
-                lambda s: (isinstance(s, str) and normalize_dash(s)) or s).to_csv(ds_path + '.csv', header=False)
     except Exception as e:
         print(ds_path, e)
         return {}
 
+    return read_table_fields(ds_path, dfs)
+
+
+def read_table_fields(ds_path, dfs):
+    """
+    Detect fields in the rows of table DataFrames (tabula or `words_tables`).
+    """
+    import pandas as pd
+
     mfr = ds_path.split('/')[-2]
     fields_detect = get_field_detect_regex(mfr)
 
@@ -514,4 +625,21 @@ def find_value(pdf_text, label, unit):
     return val
 
 
-dim_regs = get_dimensional_regular_expressions()
+_dim_regs = None
+
+
+def get_dim_regs():
+    """
+    Compiled `get_dimensional_regular_expressions`, built on first use.
+    """
+    global _dim_regs
+    if _dim_regs is None:
+        _dim_regs = get_dimensional_regular_expressions()
+    return _dim_regs
+
+
+def __getattr__(name):
+    # `dim_regs` used to be compiled at import time
+    if name == 'dim_regs':
+        return get_dim_regs()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
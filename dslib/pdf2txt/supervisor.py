@@ -0,0 +1,343 @@
+"""
+Supervised worker processes for per-PDF extraction. Each task gets a wall-clock timeout and its worker (including
+child processes like tabula's JVM) a memory limit. Stuck or oversized workers are killed and replaced, the PDF is
+recorded in the failure registry (`failures.py`) under the stage of the function, so later runs skip it:
+
+    with SupervisedExecutor(workers=8, timeout=120, max_memory_mb=2000) as ex:
+        for args, result, error in ex.map(parse_datasheet, [(path,) for path in pdfs]):
+            ...
+
+The memory limit needs psutil (RSS of the worker process tree), without it only timeouts are enforced.
+
+Results that are lists of DataFrames (`tabula_pdf_dataframes`, `pymupdf_tables`) don't go through the pipe, the
+worker writes them as Arrow IPC (`cache.ArrowFramesFile`) into shared memory (/dev/shm) and the parent maps them.
+Everything else (e.g. the Field dicts of `parse_datasheet`, small) is pickled through the pipe.
+"""
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Iterable, Optional
+
+from dslib import get_logger
+
+logger = get_logger()
+
+
+class WorkerKilled(Exception):
+    """
+    The worker running the task was killed (timeout, memory limit) or died.
+    """
+    pass
+
+
+class _ArrowResult:
+    """
+    Reference to a result in an Arrow frames file in shared memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        from dslib.cache import ArrowFramesFile
+        try:
+            # memory-mapped, unlinking keeps the mapping valid
+            return ArrowFramesFile.read(self.path)
+        finally:
+            os.unlink(self.path)
+
+
+def _shm_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
+
+def _pack_result(res, result_dir, task_id):
+    if result_dir is None:
+        return res
+    from dslib.cache import ArrowFramesFile
+    frames = ArrowFramesFile.frames_of(res)
+    if frames is None or not frames[0]:
+        return res
+    path = os.path.join(result_dir, '%d-%d.arrows' % (os.getpid(), task_id))
+    try:
+        ArrowFramesFile.write(path, *frames)
+    except (ImportError, ValueError):
+        # no pyarrow, or frames that don't round-trip through arrow
+        if os.path.exists(path):
+            os.unlink(path)
+        return res
+    return _ArrowResult(path)
+
+
+def _worker_main(conn, result_dir=None):
+    if hasattr(os, 'setpgrp'):
+        # own process group, so killing the worker also kills its children (tabula's java)
+        os.setpgrp()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        task_id, fn, args, kwargs = msg
+        try:
+            conn.send((task_id, _pack_result(fn(*args, **kwargs), result_dir, task_id), None))
+        except Exception as e:
+            try:
+                conn.send((task_id, None, e))
+            except Exception:
+                # exception not picklable
+                conn.send((task_id, None, RuntimeError('%s: %s' % (type(e).__name__, e))))
+
+
+class _Worker:
+    def __init__(self, ctx, result_dir=None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, result_dir), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+        self.n_done = 0
+
+    def submit(self, task_id, fn, args, kwargs):
+        self.task = (task_id, args, kwargs)
+        self.started = time.time()
+        self.conn.send((task_id, fn, args, kwargs))
+
+    def rss(self) -> Optional[int]:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        try:
+            p = psutil.Process(self.process.pid)
+            return p.memory_info().rss + sum(c.memory_info().rss for c in p.children(recursive=True))
+        except psutil.Error:
+            return None
+
+    def kill(self):
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+
+
+def record_failure(fn, pdf_path, error):
+    """
+    Record a killed task in the failure registry, under the stage of `fn` (see `failures.failure_guarded`).
+    """
+    stage = getattr(fn, 'failure_stage', None)
+    if not stage or not pdf_path:
+        return
+    from dslib.cache import file_digest
+    from dslib.pdf2txt.failures import failure_registry
+    try:
+        failure_registry().record(file_digest(pdf_path), stage, fn.failure_version(), pdf_path, error)
+    except Exception as e:
+        logger.warning('could not record failure of %s: %s', pdf_path, e)
+
+
+class SupervisedExecutor:
+    def __init__(self, workers=None, timeout: Optional[float] = 300, max_memory_mb: Optional[float] = None,
+                 max_tasks_per_worker=100, poll_interval=.5, shm_results=True):
+        """
+        :param timeout: wall-clock seconds per task
+        :param max_memory_mb: RSS limit of a worker and its children
+        :param max_tasks_per_worker: recycle workers after this many tasks (leaks, JVM growth)
+        :param shm_results: hand over DataFrame lists as Arrow in shared memory instead of pickling them
+        """
+        self.n_workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.max_memory = max_memory_mb and max_memory_mb * 1e6
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.poll_interval = poll_interval
+        # not fork: a forked worker would inherit the parent's sqlite connections (failure registry, cache index)
+        # and locks held by its housekeeping threads
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._workers = []
+        self.stats = dict(done=0, failed=0, timeouts=0, memory_kills=0, crashes=0)
+        # files of killed workers are left behind, removed with the dir on shutdown
+        self._result_dir = tempfile.mkdtemp(prefix='dslib-results-', dir=_shm_dir()) if shm_results else None
+
+        if self.max_memory:
+            try:
+                import psutil
+            except ImportError:
+                logger.warning('psutil not installed, memory limit of %.0fMB not enforced', max_memory_mb)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        for w in self._workers:
+            w.stop()
+        self._workers = []
+        if self._result_dir:
+            shutil.rmtree(self._result_dir, ignore_errors=True)
+            self._result_dir = None
+
+    def map(self, fn: Callable, items: Iterable[tuple], failure_fn: Callable = None):
+        """
+        Run `fn(*args)` for each args tuple in `items`, the first argument is the pdf path.
+        Yields (args, result, exception) in completion order.
+        :param failure_fn: function whose failure stage timeouts and kills are recorded under, defaults to `fn`
+        """
+        failure_fn = failure_fn or fn
+        pending = list(enumerate(items))[::-1]
+        while len(self._workers) < min(self.n_workers, len(pending)):
+            self._workers.append(_Worker(self._ctx, self._result_dir))
+
+        def _replace(w):
+            self._workers[self._workers.index(w)] = _Worker(self._ctx, self._result_dir)
+
+        while pending or any(w.task for w in self._workers):
+            for w in self._workers:
+                if w.task is None and pending:
+                    task_id, args = pending.pop()
+                    w.submit(task_id, fn, args, {})
+
+            busy = [w for w in self._workers if w.task is not None]
+            ready = wait([w.conn for w in busy], timeout=self.poll_interval)
+
+            for w in busy:
+                _, args, _ = w.task
+                if w.conn in ready:
+                    try:
+                        task_id, result, error = w.conn.recv()
+                    except (EOFError, OSError):
+                        # died without an answer (segfault, oom killer)
+                        self.stats['crashes'] += 1
+                        err = WorkerKilled('worker died (exit code %s)' % w.process.exitcode)
+                        record_failure(failure_fn, args[0], err)
+                        w.kill()
+                        _replace(w)
+                        yield args, None, err
+                        continue
+                    w.task = None
+                    w.n_done += 1
+                    if isinstance(result, _ArrowResult):
+                        try:
+                            result = result.load()
+                        except Exception as e:
+                            result, error = None, e
+                    self.stats['done' if error is None else 'failed'] += 1
+                    yield args, result, error
+                    if w.n_done >= self.max_tasks_per_worker:
+                        w.stop()
+                        _replace(w)
+                    continue
+
+                err = None
+                if self.timeout and time.time() - w.started > self.timeout:
+                    self.stats['timeouts'] += 1
+                    err = WorkerKilled('timeout after %gs' % self.timeout)
+                elif self.max_memory:
+                    rss = w.rss()
+                    if rss and rss > self.max_memory:
+                        self.stats['memory_kills'] += 1
+                        err = WorkerKilled('memory limit, rss %.0fMB' % (rss / 1e6))
+                if err:
+                    logger.warning('killing worker on %s: %s', args[0], err)
+                    w.kill()
+                    record_failure(failure_fn, args[0], err)
+                    _replace(w)
+                    yield args, None, err
+
+
+def _sleep(pdf_path, t):
+    time.sleep(t)
+    return pdf_path
+
+
+def _alloc(pdf_path, mb):
+    b = bytearray(int(mb * 1e6))
+    time.sleep(3)
+    return len(b)
+
+
+def _frames(pdf_path, n):
+    import pandas as pd
+    return [pd.DataFrame({0: ['Qrr', 'Qg'], 1: [str(n), '-']}), pd.DataFrame({'a': range(n)})]
+
+
+def _registry_open(pdf_path):
+    from dslib.pdf2txt import failures
+    return failures._registry is not None and failures._registry._con is not None
+
+
+class _StubStage:
+    failure_stage = 'test'
+
+    @staticmethod
+    def failure_version():
+        return 'v1'
+
+
+def tests():
+    with SupervisedExecutor(workers=2, timeout=1, max_memory_mb=300, poll_interval=.1) as ex:
+        res = {args[0]: (r, e) for args, r, e in ex.map(_sleep, [('a', .1), ('b', 5), ('c', .1)])}
+        assert res['a'] == ('a', None) and res['c'] == ('c', None)
+        assert isinstance(res['b'][1], WorkerKilled)
+
+        res = list(ex.map(_alloc, [('x', 500)]))
+        try:
+            import psutil
+            assert isinstance(res[0][2], WorkerKilled), res
+        except ImportError:
+            pass
+
+        res = list(ex.map(_sleep, [('y', 'not a number')]))
+        assert isinstance(res[0][2], TypeError)
+        assert ex.stats['timeouts'] == 1
+
+        (_, dfs, err), = ex.map(_frames, [('z', 3)])
+        assert err is None and list(dfs[0][1]) == ['3', '-'] and list(dfs[1].a) == [0, 1, 2]
+        assert not os.listdir(ex._result_dir)
+
+    # the parent records a timeout (opening its registry connection), the replacement worker must not inherit it
+    from dslib.pdf2txt import failures
+    d = tempfile.mkdtemp()
+    pdf = os.path.join(d, 'a.pdf')
+    with open(pdf, 'wb') as fh:
+        fh.write(b'%PDF-1.4')
+    registry = failures._registry
+    failures._registry = failures.FailureRegistry(os.path.join(d, 'f.sqlite'))
+    try:
+        with SupervisedExecutor(workers=1, timeout=.5, poll_interval=.1, shm_results=False) as ex:
+            (_, _, err), = ex.map(_sleep, [(pdf, 5)], failure_fn=_StubStage)
+            assert isinstance(err, WorkerKilled)
+            assert failures._registry.report()[0]['stage'] == 'test'
+            (_, is_open, err), = ex.map(_registry_open, [(pdf,)])
+            assert err is None and not is_open
+    finally:
+        failures._registry.close()
+        failures._registry = registry
+        shutil.rmtree(d, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    tests()
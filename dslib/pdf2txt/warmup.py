@@ -0,0 +1,136 @@
+"""
+Fill the datasheet caches (`extract_text`, `tabula_pdf_dataframes`, `parse_datasheet`) in parallel, so later
+pipeline runs are cache hits. Expects the layout of the datasheets dir, `<dir>/<mfr>/<mpn>.pdf`:
+
+    python -m dslib.pdf2txt.warmup datasheets
+    python -m dslib.pdf2txt.warmup datasheets --workers 16 --mfr infineon --mfr onsemi
+
+Cache keys hold the PDF content hash, not its path, so the datasheet dir (and the cache) can live anywhere.
+Workers are supervised (`supervisor.py`): a datasheet exceeding `--timeout` or `--max-memory` is killed, recorded
+as a 'parse' failure and skipped by later runs.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+
+def find_datasheets(datasheet_dir, mfrs=None):
+    """
+    :return: [(pdf_path, mfr, mpn)], largest files first (they take longest, starting them early shortens the tail)
+    """
+    items = []
+    for fn in glob.glob(os.path.join(datasheet_dir, '*', '*.pdf')):
+        mfr = os.path.basename(os.path.dirname(fn))
+        if mfrs and mfr not in mfrs:
+            continue
+        mpn = os.path.basename(fn)[:-4]
+        items.append((os.path.join(datasheet_dir, mfr, mpn + '.pdf'), mfr, mpn))
+    items.sort(key=lambda it: os.path.getsize(it[0]), reverse=True)
+    return items
+
+
+def warm_datasheet(pdf_path, mfr, mpn):
+    """
+    :return: (pdf_path, seconds, error or None)
+    """
+    from dslib.cache import dependency_stat_cache
+    from dslib.pdf2txt.parse import parse_datasheet
+    t0 = time.time()
+    try:
+        # same arguments as main.py, parse_datasheet fills the text and tabula caches on the way. the stages
+        # stat the pdf once
+        with dependency_stat_cache():
+            parse_datasheet(pdf_path, mfr=mfr, mpn=mpn)
+        return pdf_path, time.time() - t0, None
+    except Exception as e:
+        return pdf_path, time.time() - t0, '%s: %s' % (type(e).__name__, e)
+
+
+def _fmt_duration(s):
+    s = int(s)
+    return '%d:%02d:%02d' % (s // 3600, s // 60 % 60, s % 60)
+
+
+def uncached_datasheets(items):
+    """
+    :return: the items whose `parse_datasheet` result is neither cached nor a recorded failure
+    """
+    from dslib.cache import dependency_stat_cache, file_digest
+    from dslib.pdf2txt.failures import failure_registry
+    from dslib.pdf2txt.parse import parse_datasheet
+    todo = []
+    with dependency_stat_cache():
+        for it in items:
+            pdf_path, mfr, mpn = it
+            if parse_datasheet.cached(pdf_path, mfr=mfr, mpn=mpn):
+                continue
+            if failure_registry().should_skip(file_digest(pdf_path), parse_datasheet.failure_stage,
+                                              parse_datasheet.failure_version()):
+                continue
+            todo.append(it)
+    return todo
+
+
+def warm_datasheets(items, workers=None, timeout=300, max_memory_mb=None, progress_interval=2.):
+    """
+    :param items: [(pdf_path, mfr, mpn)], cached ones are skipped
+    :param timeout: seconds per datasheet
+    :return: list of (pdf_path, error) of failed datasheets
+    """
+    from dslib.pdf2txt.parse import parse_datasheet
+    from dslib.pdf2txt.supervisor import SupervisedExecutor
+
+    items = uncached_datasheets(items)
+    n = len(items)
+    if not n:
+        return []
+    workers = workers or os.cpu_count()
+    print('warming caches of %d datasheets with %d workers' % (n, workers), file=sys.stderr)
+
+    failed = []
+    t0 = last_print = time.time()
+    done = 0
+    with SupervisedExecutor(workers=workers, timeout=timeout, max_memory_mb=max_memory_mb) as ex:
+        for args, res, err in ex.map(warm_datasheet, items, failure_fn=parse_datasheet):
+            pdf_path, dt, err = res or (args[0], None, '%s: %s' % (type(err).__name__, err))
+            done += 1
+            if err:
+                failed.append((pdf_path, err))
+            t = time.time()
+            if t - last_print >= progress_interval or done == n:
+                last_print = t
+                rate = done / (t - t0)
+                eta = (n - done) / rate if rate else 0
+                print('%d/%d (%.0f%%) %.1f/s failed %d  elapsed %s  ETA %s' % (
+                    done, n, done / n * 100, rate, len(failed), _fmt_duration(t - t0), _fmt_duration(eta)),
+                      file=sys.stderr)
+
+    return failed
+
+
+def warmup(datasheet_dir, workers=None, mfrs=None, **kwargs):
+    """
+    :return: list of (pdf_path, error) of failed datasheets
+    """
+    return warm_datasheets(find_datasheets(datasheet_dir, mfrs), workers=workers, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dslib.pdf2txt.warmup', description=__doc__.split('\n\n')[0])
+    parser.add_argument('datasheet_dir', nargs='?', default='datasheets')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to cpu count')
+    parser.add_argument('--mfr', action='append', help='only these manufacturers (repeatable)')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds per datasheet')
+    parser.add_argument('--max-memory', type=float, default=None, help='MB per worker (needs psutil)')
+    args = parser.parse_args(argv)
+
+    failed = warmup(args.datasheet_dir, workers=args.workers, mfrs=set(args.mfr) if args.mfr else None,
+                    timeout=args.timeout, max_memory_mb=args.max_memory)
+    for pdf_path, err in sorted(failed):
+        print(pdf_path, err)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Table reconstruction from PyMuPDF word boxes, a fast alternative to tabula (no JVM).
+
+Words (`page.get_text('words')`) are grouped into lines by their vertical center, words of a line into cells by the
+horizontal gap between them. Runs of consecutive lines with 2 or more cells are tables. Columns of a table are the
+gaps in the horizontal projection of all its cells, each cell goes to the column containing its center.
+
+Emits the same kind of DataFrame list as `tabula_pdf_dataframes` (integer column labels, str cells, NaN if empty),
+so `tabula_read` (`read_table_fields`) consumes it unchanged.
+"""
+from typing import List
+
+
+def group_lines(words, y_tol=None) -> list:
+    """
+    :param words: (x0, y0, x1, y1, text, ...) tuples
+    :return: lines, each a list of words sorted by x
+    """
+    if not words:
+        return []
+    heights = sorted(w[3] - w[1] for w in words)
+    h = heights[len(heights) // 2]
+    if y_tol is None:
+        y_tol = h * .4
+
+    lines = []
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        yc = (w[1] + w[3]) / 2
+        if lines and abs(yc - lines[-1][0]) <= y_tol:
+            lines[-1][1].append(w)
+        else:
+            lines.append([yc, [w]])
+    return [sorted(ws, key=lambda w: w[0]) for _, ws in lines]
+
+
+def line_cells(line, gap) -> list:
+    """
+    Merge the words of a line into cells, a new cell starts where the gap to the previous word exceeds `gap`.
+    :return: [(x0, x1, text)]
+    """
+    cells = []
+    for w in line:
+        if cells and w[0] - cells[-1][1] <= gap:
+            x0, _, text = cells[-1]
+            cells[-1] = (x0, max(cells[-1][1], w[2]), text + ' ' + w[4])
+        else:
+            cells.append((w[0], w[2], w[4]))
+    return cells
+
+
+def column_bounds(rows) -> list:
+    """
+    :param rows: lists of cells (x0, x1, text)
+    :return: [(x0, x1)] of the columns, the covered intervals of the horizontal projection
+    """
+    spans = sorted((c[0], c[1]) for cells in rows for c in cells)
+    cols = []
+    for x0, x1 in spans:
+        if cols and x0 <= cols[-1][1]:
+            cols[-1][1] = max(cols[-1][1], x1)
+        else:
+            cols.append([x0, x1])
+    return [tuple(c) for c in cols]
+
+
+def table_frame(rows):
+    import math
+    import pandas as pd
+
+    bounds = column_bounds(rows)
+    data = []
+    for cells in rows:
+        row = [math.nan] * len(bounds)
+        for x0, x1, text in cells:
+            xc = (x0 + x1) / 2
+            col = next((i for i, (b0, b1) in enumerate(bounds) if b0 <= xc <= b1), len(bounds) - 1)
+            row[col] = text if isinstance(row[col], float) else row[col] + ' ' + text
+        data.append(row)
+    return pd.DataFrame(data, columns=range(len(bounds)))
+
+
+def page_tables(words, min_rows=2) -> list:
+    """
+    :return: DataFrames of the tables of a page
+    """
+    lines = group_lines(words)
+    if not lines:
+        return []
+    heights = sorted(w[3] - w[1] for w in words)
+    gap = heights[len(heights) // 2] * .5
+
+    tables, run = [], []
+    for line in lines:
+        cells = line_cells(line, gap)
+        if len(cells) >= 2:
+            run.append(cells)
+            continue
+        if len(run) >= min_rows:
+            tables.append(run)
+        run = []
+    if len(run) >= min_rows:
+        tables.append(run)
+
+    return [table_frame(rows) for rows in tables]
+
+
+def pdf_tables(pdf_path) -> List['pd.DataFrame']:
+    """
+    DataFrames of all tables found in the PDF, in page order. Scanned pages use the OCR word boxes if enabled.
+    """
+    import fitz  # PyMuPDF
+    from dslib.pdf2txt import ocr
+    ocr_res = ocr.ocr_document(pdf_path) if ocr.enabled() else {}
+    dfs = []
+    with fitz.open(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            dfs.extend(page_tables(ocr_res[i]['words'] if i in ocr_res else page.get_text('words')))
+    return dfs
+
+
+def tests():
+    #        x0   y0   x1   y1
+    words = [(10, 10, 60, 20, 'Reverse'), (63, 10, 100, 20, 'recovery'), (150, 10, 165, 20, 'Qrr'),
+             (200, 10, 210, 20, '-'), (240, 10, 255, 20, '55'), (280, 10, 295, 20, '80'), (320, 10, 332, 20, 'nC'),
+             (10, 30, 40, 40, 'Gate'), (43, 30, 80, 40, 'charge'), (150, 31, 162, 41, 'Qg'),
+             (200, 30, 210, 40, '-'), (240, 30, 258, 40, '100'), (280, 30, 298, 40, '130'),
+             (320, 30, 332, 40, 'nC'),
+             (10, 60, 200, 70, 'Notes:'),
+             ]
+    dfs = page_tables(words)
+    assert len(dfs) == 1
+    df = dfs[0]
+    assert list(df.iloc[0]) == ['Reverse recovery', 'Qrr', '-', '55', '80', 'nC'], list(df.iloc[0])
+    assert list(df.iloc[1]) == ['Gate charge', 'Qg', '-', '100', '130', 'nC']
+
+    # missing cell stays empty
+    words = [(10, 10, 30, 20, 'a'), (100, 10, 120, 20, 'b'), (200, 10, 220, 20, 'c'),
+             (10, 30, 30, 40, 'd'), (200, 30, 220, 40, 'f')]
+    df = page_tables(words)[0]
+    assert df.shape == (2, 3) and df.iloc[1, 2] == 'f'
+    import pandas as pd
+    assert pd.isna(df.iloc[1, 1])
+
+
+if __name__ == '__main__':
+    tests()
@@ -1,8 +1,15 @@
+import json
 import math
-from typing import Literal
+import os
+import struct
+from typing import Literal, Iterable, Tuple, Optional
+
+from dslib.units import parse_si_value
 
 
 class MosfetSpecs:
+    __slots__ = ('Vds', 'Rds_on', 'Qg', 'Qgd', 'Qgs', '_Qgs2', 'Qg_th', '_Vpl', 'Coss', 'Qoss', 'tRise', 'tFall', 'Qrr',
+                 'Vsd')
 
     def __init__(self, Vds_max, Rds_on, Qg, tRise, tFall, Qrr, Qgd=None, Qgs=None, Qgs2=None, Qg_th=None, Qsw=None,
                  Vpl=None, Vsd=None, Coss=None):
@@ -26,14 +33,16 @@ class MosfetSpecs:
         self.Vds = Vds_max
 
         if isinstance(Rds_on, str):
-            if Rds_on.endswith('mOhm'):
-                Rds_on = float(Rds_on[:-4].strip()) * 1e-3
+            Rds_on_ = parse_si_value(Rds_on, 'Ohm')
+            if math.isnan(Rds_on_):
+                raise ValueError('Rds_on must be a resistance: %s' % Rds_on)
+            Rds_on = Rds_on_
 
         if isinstance(Qg, str):
-            if Qg.endswith('nC'):
-                Qg = float(Qg[:-2].strip()) * 1e-9
-            else:
-                raise ValueError('Qg must be either nC: %s' % Qg)
+            Qg_ = parse_si_value(Qg, 'C')
+            if math.isnan(Qg_):
+                raise ValueError('Qg must be a charge: %s' % Qg)
+            Qg = Qg_
 
         self.Rds_on = Rds_on
 
@@ -57,16 +66,38 @@ class MosfetSpecs:
         assert not Vpl or (2 <= Vpl <= 9), "Vpl %s must be between 2 and 8" % Vpl
 
         self.Coss = Coss or math.nan
+        self.Qoss = math.nan
         self.tRise = tRise or math.nan
         self.tFall = tFall or math.nan
         self.Qrr = math.nan if Qrr is None else Qrr  # GaN have Qrr = 0
         self.Vsd = Vsd  # body diode forward
 
-        assert 1e-9 < Qg < 1000e-9, Qg
+        self._validate()
+
+    def _validate(self):
+        assert 1e-9 < self.Qg < 1000e-9, self.Qg
         assert math.isnan(self.Qrr) or 0 <= self.Qrr < 4000e-9, self.Qrr  # GaN have 0 qrr
         assert math.isnan(self.tRise) or .5e-9 <= self.tRise < 1000e-9, self.tRise
         assert math.isnan(self.tFall) or 1e-9 < self.tFall < 1000e-9, self.tFall
-        assert Vsd is None or 0.2 < Vsd < 2, Vsd
+        assert self.Vsd is None or math.isnan(self.Vsd) or 0.2 < self.Vsd < 2, self.Vsd
+
+    @classmethod
+    def _from_values(cls, values: dict) -> 'MosfetSpecs':
+        # values were validated when the specs were created, skip __init__
+        obj = cls.__new__(cls)
+        for k in cls.__slots__:
+            setattr(obj, k, values.get(k, math.nan))
+        return obj
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # pickled before __slots__
+            state = tuple(state.get(k, math.nan) for k in self.__slots__)
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
 
     @staticmethod
     def from_mpn(mpn, mfr) -> 'MosfetSpecs':
@@ -109,6 +140,156 @@ class MosfetSpecs:
         return f'MosfetSpecs({self.Vds}V,{round(self.Rds_on * 1e3, 1)}mR Qg={round(self.Qg * 1e9)}n trf={round(self.tRise * 1e9)}/{round(self.tFall * 1e9)}n Qrr={round(self.Qrr * 1e9)}n)'
 
 
+class MosfetSpecsTable:
+    """
+    Struct-of-arrays container for many MosfetSpecs, one float64 column per spec field plus mfr and mpn columns.
+
+    `save` writes all columns into a single binary file, `load` memory-maps them (no unpickling, no copies).
+    `specs` hands out the MosfetSpecs of a single row.
+
+    Rows are stored sorted by (mfr, mpn), so the mfr and mpn columns double as the on-disk index:
+    `lookup` binary-searches them in the mapped file and reads the 8 bytes at `column offset + 8 * row` of each
+    spec column. It only needs the standard library and touches a few pages, independent of the library size.
+    """
+    fields = MosfetSpecs.__slots__
+    _magic = b'MOSFETSPECSTABLE1\n'
+
+    def __init__(self, mfr, mpn, columns: dict):
+        self.mfr = mfr
+        self.mpn = mpn
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.mpn)
+
+    @classmethod
+    def from_specs(cls, items: Iterable[Tuple[str, str, MosfetSpecs]]) -> 'MosfetSpecsTable':
+        import numpy as np
+
+        items = list(items)
+        columns = {k: np.array([_to_float(getattr(s, k)) for _, _, s in items], dtype=np.float64)
+                   for k in cls.fields}
+        mfr = np.array([m for m, _, _ in items], dtype=str)
+        mpn = np.array([p for _, p, _ in items], dtype=str)
+        return cls(mfr, mpn, columns)
+
+    def specs(self, i) -> MosfetSpecs:
+        return MosfetSpecs._from_values({k: float(c[i]) for k, c in self.columns.items()})
+
+    def save(self, path):
+        import numpy as np
+
+        order = np.lexsort((self.mpn, self.mfr))
+        arrays = dict(mfr=self.mfr[order], mpn=self.mpn[order], **{k: c[order] for k, c in self.columns.items()})
+        header = dict(n=len(self), columns={})
+        offset = 0
+        for k, a in arrays.items():
+            offset = -(-offset // 64) * 64  # align columns
+            header['columns'][k] = (np.asarray(a).dtype.str, offset)
+            offset += np.asarray(a).nbytes
+        hb = json.dumps(header).encode('utf-8')
+        data_start = -(-(len(self._magic) + 8 + len(hb)) // 64) * 64
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._magic)
+            f.write(len(hb).to_bytes(8, 'little'))
+            f.write(hb)
+            for k, a in arrays.items():
+                f.seek(data_start + header['columns'][k][1])
+                f.write(np.ascontiguousarray(a).tobytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> 'MosfetSpecsTable':
+        import numpy as np
+
+        with open(path, 'rb') as f:
+            assert f.read(len(cls._magic)) == cls._magic, 'not a specs table file: %s' % path
+            hl = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(hl))
+        data_start = -(-(len(cls._magic) + 8 + hl) // 64) * 64
+
+        n = header['n']
+        arrays = {}
+        for k, (dt, off) in header['columns'].items():
+            if n:
+                arrays[k] = np.memmap(path, dtype=np.dtype(dt), mode='r', offset=data_start + off, shape=(n,))
+            else:
+                arrays[k] = np.empty(0, dtype=np.dtype(dt))
+        mfr = arrays.pop('mfr')
+        mpn = arrays.pop('mpn')
+        return cls(mfr, mpn, arrays)
+
+    @classmethod
+    def lookup(cls, path, mfr, mpn) -> Optional[MosfetSpecs]:
+        """
+        Read the specs of a single part from a table file without loading the table.
+        """
+        return _MappedSpecsTable.open(path, cls._magic).get(mfr, mpn)
+
+
+class _MappedSpecsTable:
+    _open = {}
+
+    def __init__(self, path, magic):
+        import mmap
+        with open(path, 'rb') as f:
+            assert f.read(len(magic)) == magic, 'not a specs table file: %s' % path
+            hl = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(hl))
+            self.n = header['n']
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.n else None
+        data_start = -(-(len(magic) + 8 + hl) // 64) * 64
+        self.columns = {k: (dt, data_start + off) for k, (dt, off) in header['columns'].items()}
+
+    @classmethod
+    def open(cls, path, magic) -> '_MappedSpecsTable':
+        st = os.stat(path)
+        k = (path, st.st_mtime_ns, st.st_size)
+        t = cls._open.get(k)
+        if t is None:
+            cls._open.clear()
+            t = cls._open[k] = cls(path, magic)
+        return t
+
+    def _str(self, col, i):
+        dt, off = self.columns[col]
+        assert dt[:2] == '<U', dt
+        w = int(dt[2:]) * 4
+        return self.mm[off + i * w:off + (i + 1) * w].decode('utf-32-le').rstrip('\0')
+
+    def _float(self, col, i):
+        dt, off = self.columns[col]
+        assert dt == '<f8', dt
+        return struct.unpack_from('<d', self.mm, off + i * 8)[0]
+
+    def find(self, mfr, mpn) -> Optional[int]:
+        key = (mfr, mpn)
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self._str('mfr', mid), self._str('mpn', mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n and (self._str('mfr', lo), self._str('mpn', lo)) == key:
+            return lo
+        return None
+
+    def get(self, mfr, mpn) -> Optional[MosfetSpecs]:
+        i = self.find(mfr, mpn)
+        if i is None:
+            return None
+        return MosfetSpecs._from_values({k: self._float(k, i) for k in MosfetSpecs.__slots__})
+
+
+def _to_float(v):
+    if v is None:
+        return math.nan
+    return float(v)
+
+
 class DcDcSpecs:
 
     def __init__(self, vi, vo, f, Vgs, tDead=None, io=None, ii=None, pin=None, iripple=None, ripple_factor=None):
@@ -210,6 +391,22 @@ class DcDcSpecs:
 
 
 def tests():
+    mf = MosfetSpecs(100, '17.7mOhm @ 20A, 10V', '41 nC @ 10 V', None, None, None)
+    assert mf.Rds_on == 17.7e-3 and mf.Qg == 41e-9
+    mf = MosfetSpecs(100, '850 µΩ', '0.2 µC', None, None, None)
+    assert mf.Rds_on == 850e-6 and abs(mf.Qg - 200e-9) < 1e-15
+
+    mf = MosfetSpecs(100, 10e-3, 100e-9, 40e-9, 40e-9, 120e-9, Qgd=3e-9, Vsd=.9)
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        MosfetSpecsTable.from_specs([('ti', 'A', mf), ('ao', 'B', mf)]).save(d + '/t.bin')
+        tbl = MosfetSpecsTable.load(d + '/t.bin')
+        assert len(tbl) == 2 and list(tbl.mfr) == ['ao', 'ti']  # sorted
+        s = tbl.specs(0)
+        assert MosfetSpecsTable.lookup(d + '/t.bin', 'ao', 'B').Qgd == mf.Qgd
+        assert MosfetSpecsTable.lookup(d + '/t.bin', 'ti', 'B') is None
+        assert s.Vds == mf.Vds and s.Qg == mf.Qg and s.Qgd == mf.Qgd and s.Vsd == mf.Vsd and math.isnan(s.Coss)
+
     io = 10
     d1 = DcDcSpecs(24, 12, 40e3, 10, 0, io=io, ripple_factor=0.001)
     assert abs(d1.Io_mean_squared_on - io ** 2) / io ** 2 < 1e-3
@@ -21,6 +21,10 @@ def lib_file_path():
     return os.path.realpath(os.path.dirname(__file__) + '/../parts-lib.pkl')
 
 
+def specs_table_path():
+    return os.path.realpath(os.path.dirname(__file__) + '/../parts-lib.specs')
+
+
 _lib_mem = None
 
 
@@ -32,11 +36,37 @@ def load_parts(reload=False):
         with open(lib_file_path(), 'rb') as f:
             _lib_mem = pickle.load(f)
             return _lib_mem.copy()
+    _lib_mem = {}
     return {}
 
 
+def save_specs_table():
+    """
+    Write the MosfetSpecs of all fet parts in the library into the specs table file (see `MosfetSpecsTable`).
+    """
+    from dslib.spec_models import MosfetSpecsTable
+    MosfetSpecsTable.from_specs((p.mfr, p.mpn, p.specs) for p in load_parts().values() if p.is_fet) \
+        .save(specs_table_path())
+
+
+def _specs_table_stale():
+    if not os.path.exists(lib_file_path()):
+        return False
+    return not os.path.exists(specs_table_path()) or \
+        os.path.getmtime(specs_table_path()) < os.path.getmtime(lib_file_path())
+
+
 def load_part(mpn, mfr) -> Part:
     if not _lib_mem:
+        if _specs_table_stale():
+            # library written without the table (or changed since), needs the library loaded anyway
+            save_specs_table()
+        elif os.path.exists(specs_table_path()):
+            # indexed single-part read from the mapped specs table, neither unpickles the library nor imports numpy
+            from dslib.spec_models import MosfetSpecsTable
+            specs = MosfetSpecsTable.lookup(specs_table_path(), mfr, mpn)
+            if specs:
+                return Part(mpn=mpn, mfr=mfr, specs=specs)
         load_parts()
     return copy(_lib_mem.get((mfr, mpn)))
 
@@ -49,3 +79,4 @@ def add_parts(new_arts: Iterable[Part], overwrite=True):
         _lib_mem[k] = part
     with open(lib_file_path(), 'wb') as f:
         pickle.dump(_lib_mem, f)
+    save_specs_table()
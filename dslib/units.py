@@ -0,0 +1,131 @@
+"""
+SI unit parsing of supplier parametric strings, such as
+
+    '17.7mOhm @ 20A, 10V'
+    '41 nC @ 10 V'
+    '4.5V @ 250µA'
+    '12.6A (Ta), 51.6A (Tc)'
+
+`parse_si` parses a whole column at once (pandas string ops, no python loop over rows) and returns the values in
+the SI base unit together with the test conditions found after '@'. `parse_si_value` is the scalar variant.
+"""
+import math
+import re
+from typing import Tuple
+
+si_prefixes = {'': 1., 'p': 1e-12, 'n': 1e-9, 'u': 1e-6, 'µ': 1e-6, 'μ': 1e-6, 'm': 1e-3, 'k': 1e3, 'M': 1e6}
+
+# base unit -> spellings
+unit_aliases = dict(
+    Ohm=('Ohm', 'ohm', 'Ω', '\u2126'),
+    C=('C',),
+    V=('V',),
+    A=('A',),
+    F=('F',),
+    s=('s',),
+    Hz=('Hz',),
+    W=('W',),
+)
+
+_num = r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?'
+_prefix = '[' + ''.join(p for p in si_prefixes if p) + ']?'
+
+
+def _unit_regex(units):
+    alts = sorted((a for u in units for a in unit_aliases[u]), key=len, reverse=True)
+    return '(?:' + '|'.join(map(re.escape, alts)) + ')'
+
+
+def _value_regex(unit):
+    return rf'^\s*(?P<num>{_num})\s*(?P<prefix>{_prefix})(?P<unit>{_unit_regex([unit])})(?![a-zA-Z])'
+
+
+_alias_to_unit = {a: u for u, aliases in unit_aliases.items() for a in aliases}
+_cond_regex = rf'(?P<num>{_num})\s*(?P<prefix>{_prefix})(?P<unit>{_unit_regex(unit_aliases)})(?![a-zA-Z])'
+_value_regex_compiled = {}
+
+
+def parse_si_value(s, unit) -> float:
+    """
+    Parse a single string like '17.7mOhm' or '41 nC @ 10 V' into a float of the SI base unit.
+    Returns nan if the string does not contain a value of the given unit.
+    """
+    if isinstance(s, (float, int)):
+        return float(s)
+    r = _value_regex_compiled.get(unit)
+    if r is None:
+        r = _value_regex_compiled[unit] = re.compile(_value_regex(unit))
+    m = r.match(s.split('@', 1)[0])
+    if m is None:
+        return math.nan
+    return float(m['num']) * si_prefixes[m['prefix']]
+
+
+def parse_si(values, unit, conditions=True) -> Tuple['np.ndarray', 'pd.DataFrame']:
+    """
+    Parse a column of parametric strings into floats of the SI base unit.
+
+    Everything after the first '@' is the test condition. Condition values are parsed too and returned in a
+    DataFrame with one column per base unit (first occurrence), e.g. '17.7mOhm @ 20A, 10V' -> {'A': 20, 'V': 10}.
+
+    :param values: iterable of strings (pd.Series, list, np.ndarray)
+    :param unit: base unit of the value, one of `unit_aliases`
+    :param conditions: whether to parse the test conditions (otherwise returns None)
+    :return: (float64 array, conditions DataFrame indexed like the input)
+    """
+    import numpy as np
+    import pandas as pd
+
+    col = values if isinstance(values, pd.Series) else pd.Series(values)
+    parts = col.astype(str).str.split('@', n=1, expand=True)
+
+    m = parts[0].str.extract(_value_regex(unit), expand=True)
+    mul = m.prefix.fillna('').map(si_prefixes).astype(float)
+    arr = (pd.to_numeric(m.num, errors='coerce') * mul).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    if not conditions:
+        return arr, None
+
+    if parts.shape[1] < 2:
+        return arr, pd.DataFrame(index=col.index)
+
+    cm = parts[1].str.extractall(_cond_regex)
+    if cm.empty:
+        return arr, pd.DataFrame(index=col.index)
+    cm['value'] = pd.to_numeric(cm.num, errors='coerce') * cm.prefix.fillna('').map(si_prefixes).astype(float)
+    cm['unit'] = cm.unit.map(_alias_to_unit)
+    cm = cm.reset_index(level='match')
+    cond = cm.groupby([cm.index, 'unit'])['value'].first().unstack('unit')
+    cond.columns.name = None
+    return arr, cond.reindex(col.index)
+
+
+def tests():
+    assert parse_si_value('17.7mOhm', 'Ohm') == 17.7e-3
+    assert parse_si_value('41 nC @ 10 V', 'C') == 41e-9
+    assert parse_si_value('2 µC', 'C') == 2e-6
+    assert parse_si_value('3.3 mΩ', 'Ohm') == 3.3e-3
+    assert math.isnan(parse_si_value('41 nC', 'V'))
+    assert math.isnan(parse_si_value('-', 'V'))
+
+    import numpy as np
+    v, cond = parse_si(['17.7mOhm @ 20A, 10V', '850µΩ @ 50A, 10V', '1.2 Ohm', '-', None], 'Ohm')
+    assert np.allclose(v[:3], [17.7e-3, 850e-6, 1.2])
+    assert np.isnan(v[3:]).all()
+    assert cond.A[0] == 20 and cond.V[0] == 10 and cond.A[1] == 50
+    assert np.isnan(cond.A[2])
+
+    v, cond = parse_si(['4.5V @ 250µA', '3V @ 1mA', '500 mV @ 1 mA'], 'V')
+    assert np.allclose(v, [4.5, 3, .5])
+    assert np.allclose(cond.A, [250e-6, 1e-3, 1e-3])
+
+    v, cond = parse_si(['41 nC @ 10 V', '1.5 µC @ 10 V', '900 pC @ 4.5 V'], 'C')
+    assert np.allclose(v, [41e-9, 1.5e-6, 900e-12])
+    assert np.allclose(cond.V, [10, 10, 4.5])
+
+    v, _ = parse_si(['12.6A (Ta), 51.6A (Tc)', '150 V', '80A'], 'A', conditions=False)
+    assert v[0] == 12.6 and np.isnan(v[1]) and v[2] == 80
+
+
+if __name__ == '__main__':
+    tests()
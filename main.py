@@ -1,14 +1,17 @@
-import glob
 import math
 import os.path
 
 import pandas as pd
 
 import dslib.manual_fields
-from dslib import mfr_tag, round_to_n
+from dslib import round_to_n
+from dslib.cache import dependency_stat_cache
 from dslib.fetch import fetch_datasheet
 from dslib.field import Field
+from dslib.part_sources import read_part_list
+from dslib.pdf2txt.failures import KnownFailure
 from dslib.pdf2txt.parse import parse_datasheet
+from dslib.pdf2txt.warmup import warm_datasheets
 from dslib.powerloss import dcdc_buck_hs, dcdc_buck_ls
 from dslib.spec_models import MosfetSpecs, DcDcSpecs
 from dslib.store import Part
@@ -17,24 +20,33 @@ from dslib.store import Part
 def main():
     dcdc = DcDcSpecs(vi=62, vo=27, pin=800, f=40e3, Vgs=12, ripple_factor=0.3, tDead=500e-9)
     print(dcdc.Io)
-    read_digikey_results(csv_path='digikey-results/*.csv', dcdc=dcdc)
+    # datasheets are stat'ed once per run, not on every cached stage call
+    with dependency_stat_cache():
+        read_digikey_results(csv_path='digikey-results/*.csv', dcdc=dcdc)
 
 
 def read_digikey_results(csv_path, dcdc: DcDcSpecs):
-    df = pd.concat([pd.read_csv(fn) for fn in sorted(glob.glob(csv_path))], axis=0, ignore_index=True)
-    # df = pd.read_csv(csv_path)
+    df = read_part_list(csv_path, source='digikey')
 
     result_rows = []  # csv
     result_parts = []  # db storage
 
-    for i, row in df.iterrows():
-        mfr = mfr_tag(row.Mfr)
-        mpn = str(row['Mfr Part #'])
-        ds_url = row.Datasheet
+    # fetch, then parse the uncached datasheets in supervised worker processes, a stuck PDF is killed after the
+    # timeout and recorded as failure. the loop below reads the parse_datasheet cache
+    ds_items = []
+    for row in df.itertuples(index=False):
+        datasheet_path = os.path.join('datasheets', row.mfr, row.mpn + '.pdf')
+        if not os.path.exists(datasheet_path):
+            fetch_datasheet(row.datasheet, datasheet_path, mfr=row.mfr, mpn=row.mpn)
+        if os.path.isfile(datasheet_path):
+            ds_items.append((datasheet_path, row.mfr, row.mpn))
+    warm_datasheets(ds_items, timeout=120)
+
+    for row in df.itertuples(index=False):
+        mfr = row.mfr
+        mpn = row.mpn
 
         datasheet_path = os.path.join('datasheets', mfr, mpn + '.pdf')
-        if not os.path.exists(datasheet_path):
-            fetch_datasheet(ds_url, datasheet_path, mfr=mfr, mpn=mpn)
 
         ds = {}
 
@@ -47,7 +59,11 @@ def read_digikey_results(csv_path, dcdc: DcDcSpecs):
 
         # parse datasheet (tabula and pdf2txt):
         if os.path.isfile(datasheet_path):
-            dsp = parse_datasheet(datasheet_path, mfr=mfr, mpn=mpn)
+            try:
+                dsp = parse_datasheet(datasheet_path, mfr=mfr, mpn=mpn)
+            except KnownFailure as e:
+                print(mfr, mpn, e)
+                dsp = {}
             for k, f in dsp.items():
                 if k not in ds:
                     ds[k] = f
@@ -81,9 +97,9 @@ def read_digikey_results(csv_path, dcdc: DcDcSpecs):
             field_mul = lambda sym: 1 if sym[0] == 'V' else 1e-9
 
             fet_specs = MosfetSpecs(
-                Vds_max=row['Drain to Source Voltage (Vdss)'].strip(' V'),
-                Rds_on=row['Rds On (Max) @ Id, Vgs'].split('@')[0].strip(),
-                Qg=row['Gate Charge (Qg) (Max) @ Vgs'].split('@')[0].strip(),
+                Vds_max=row.Vds,
+                Rds_on=row.Rds_on,
+                Qg=row.Qg,
                 tRise=ds.get('tRise') and (ds.get('tRise').typ_or_max_or_min * 1e-9),
                 tFall=ds.get('tFall') and (ds.get('tFall').typ_or_max_or_min * 1e-9),
                 **{k: ds.get(k) and (ds.get(k).typ_or_max_or_min * field_mul(k)) for k in mf_fields},
@@ -118,13 +134,13 @@ def read_digikey_results(csv_path, dcdc: DcDcSpecs):
         row = dict(
             mfr=mfr,
             mpn=mpn,
-            housing=row['Package / Case'],
+            housing=row.package,
 
-            Vds=row['Drain to Source Voltage (Vdss)'].strip('V '),
+            Vds=row.Vds,
             Rds_max=fet_specs.Rds_on * 1000,
-            Id=row['Current - Continuous Drain (Id) @ 25°C'],
+            Id=row.Id,
 
-            Qg_max=row['Gate Charge (Qg) (Max) @ Vgs'].split('@')[0].strip(),
+            Qg_max=row.Qg * 1e9,
             Qgs=ds.get('Qgs') and ds.get('Qgs').typ_or_max_or_min,
             Qgd=ds.get('Qgd') and ds.get('Qgd').typ_or_max_or_min,
             Qsw=fet_specs and (fet_specs.Qsw * 1e9),
@@ -137,7 +153,7 @@ def read_digikey_results(csv_path, dcdc: DcDcSpecs):
             tRise_ns=round(fet_specs.tRise * 1e9, 1),
             tFall_ns=round(fet_specs.tFall * 1e9, 1),
 
-            Vth=row['Vgs(th) (Max) @ Id'].split('@')[0].strip('V '),
+            Vth=row.Vth,
             Vpl=fet_specs and fet_specs.V_pl,
 
             FoM=fet_specs.Rds_on * 1000 * (fet_specs.Qg * 1e9),
@@ -1,6 +1,8 @@
 import math
+import os
 
-from dslib.pdf2txt.parse import tabula_read, parse_datasheet, parse_row_value, dim_regs
+from dslib.pdf2txt.parse import tabula_read, table_fields, parse_datasheet, parse_row_value, dim_regs, \
+    qrr_candidate_text
 
 
 def parse_line_tests():
@@ -109,6 +111,14 @@ def parse_pdf_tests():
     assert d.Qgs.typ == 53
     assert d.Qgd.typ == 34 and d.Qgd.max == 51
 
+    # word boxes with tabula fill-in find every field tabula alone finds
+    for fn in ['infineon/BSC025N08LS5ATMA1', 'infineon/IPB019N08N3GATMA1', 'infineon/BSC021N08NS5ATMA1',
+               'onsemi/NTP011N15MC', 'diotec/DIT085N10-AQ', 'infineon/IAUA210N10S5N024AUMA1',
+               'infineon/IPF015N10N5ATMA1']:
+        ds_path = 'datasheets/%s.pdf' % fn
+        tab, tf = tabula_read(ds_path), table_fields(ds_path)
+        assert set(tab) <= set(tf), (fn, set(tab) - set(tf))
+
     d = parse_datasheet('datasheets/ti/CSD19532KTTT.pdf')
     assert d.Qgd.typ == 5.6
     assert d.Qgs.typ == 17
@@ -293,7 +303,36 @@ def parse_pdf_tests():
     assert d['Qrr'].typ == 112
 
 
+def qrr_candidate_tests():
+    # the condition prefix ends the previous page
+    pages = ['Features\n', 'Body diode\nIF = 20 A, di/dt = 100 A/', 'μs Reverse recovery charge Qrr 55 nC\n',
+             'Package\n', 'Ordering\n', 'Notes\n', 'Qrr test circuit\n']
+    chunks = qrr_candidate_text(pages)
+    assert chunks == [''.join(pages[1:4]), ''.join(pages[5:7])], chunks
+    assert qrr_candidate_text(['Qrr 1', 'x', 'y', 'Qrr 2']) == ['Qrr 1xyQrr 2']
+    assert qrr_candidate_text(['nothing']) == []
+
+
+def ocr_tests():
+    # own process, the stage versions of the parse caches must not see the OCR switch of the test
+    import subprocess
+    import sys
+    subprocess.run([sys.executable, '-c', 'from dslib.pdf2txt import ocr; ocr.tests()'], check=True,
+                   cwd=os.path.dirname(os.path.realpath(__file__)))
+
+
+def parse_regex_tests():
+    # backtracking, slowdown or changed results of the row regexes, see benchmarks/parse_regex.py
+    import subprocess
+    import sys
+    subprocess.run([sys.executable, 'benchmarks/parse_regex.py'], check=True,
+                   cwd=os.path.dirname(os.path.realpath(__file__)))
+
+
 if __name__ == '__main__':
+    qrr_candidate_tests()
+    ocr_tests()
+    parse_regex_tests()
     parse_line_tests()
     parse_pdf_tests()
     # tests()